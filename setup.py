@@ -18,12 +18,11 @@ setup(
     packages=["unification"],
     install_requires=[
         "toolz",
-        "multipledispatch",
     ],
     long_description=(open("README.md").read() if exists("README.md") else ""),
     long_description_content_type="text/markdown",
     zip_safe=False,
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Science/Research",
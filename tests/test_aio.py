@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from tests.utils import gen_long_chain
+from unification import var
+from unification.aio import areify, aunify
+
+
+def run_with_ticker(coro):
+    """Run `coro` alongside a task that counts the event loop's iterations."""
+
+    async def main():
+        ticks = 0
+        done = False
+
+        async def ticker():
+            nonlocal ticks
+            while not done:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(ticker())
+        try:
+            res = await coro
+        finally:
+            done = True
+            await task
+
+        return res, ticks
+
+    return asyncio.run(main())
+
+
+def test_aunify():
+    x, y = var(), var()
+    deep, _ = gen_long_chain(x, 1000)
+    deep_2, _ = gen_long_chain(2, 1000)
+
+    res, ticks = run_with_ticker(aunify((deep, y), (deep_2, 1), {}, yield_every=10))
+    assert res == {x: 2, y: 1}
+    assert ticks > 100
+
+    res, ticks = run_with_ticker(aunify((deep, y), (deep_2, 2), yield_every=10**6))
+    assert res == {x: 2, y: 2}
+    assert ticks <= 1
+
+    res, _ = run_with_ticker(aunify((deep, 2), (deep_2, 1), {}, delta=True))
+    assert res is False
+
+
+def test_areify():
+    x, y = var(), var()
+    deep, _ = gen_long_chain(x, 500)
+    expected, _ = gen_long_chain((1, 2), 500)
+
+    res, ticks = run_with_ticker(areify(deep, {x: (1, y), y: 2}, yield_every=10))
+    assert res == expected
+    assert ticks > 50
+
+    res, _ = run_with_ticker(areify(deep, {}))
+    assert res is deep
+
+
+def test_max_steps():
+    x = var()
+
+    with pytest.raises(TypeError, match="yield_every"):
+        asyncio.run(aunify(x, 1, {}, max_steps=10))
+
+    with pytest.raises(TypeError, match="yield_every"):
+        asyncio.run(areify(x, {x: 1}, max_steps=10))
+
+    with pytest.raises(ValueError, match="yield_every"):
+        asyncio.run(aunify(x, 1, {}, yield_every=0))
@@ -1,11 +1,30 @@
 import platform
 import sys
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
 from tests.utils import gen_long_chain
-from unification import assoc, isvar, reify, unify, var
+from unification import (
+    ArraySubstitution,
+    IndexedVar,
+    StepLimitExceeded,
+    Substitution,
+    UnionFindSubstitution,
+    assoc,
+    isvar,
+    normalize,
+    reify,
+    rename_apart,
+    unify,
+    var,
+    vars,
+)
+from unification.cache import disable_term_cache, enable_term_cache
+from unification.hashcons import hashcons
 from unification.utils import transitive_get as walk
+from unification.variable import fresh, isvar_strict, variables
 
 nesting_sizes = [10, 35, 300]
 
@@ -76,7 +95,7 @@ def test_reify_chain_stream(size, benchmark):
     term, _ = gen_long_chain("a", size)
 
     lvars.update({a_lv: "a"})
-    res = benchmark(reify_stack, form, lvars)
+    res = benchmark(reify, form, lvars)
     assert res == term
 
 
@@ -93,16 +112,273 @@ def test_reify_chain_stack(size, benchmark):
 
 
 @pytest.mark.benchmark(group="unify_chain")
+@pytest.mark.parametrize("s_type", [dict, Substitution])
 @pytest.mark.parametrize("size", [1000, 5000])
-def test_unify_chain_stream_large(size, benchmark):
+def test_unify_chain_stream_large(size, s_type, benchmark):
     a_lv = var()
     form, lvars = gen_long_chain(a_lv, size, use_lvars=True)
     term, _ = gen_long_chain("a", size)
 
-    res = benchmark(unify, form, term, {})
+    res = benchmark(unify, form, term, s_type())
     assert res[a_lv] == "a"
 
 
+@pytest.mark.benchmark(group="unify_var_chain")
+@pytest.mark.parametrize("s_type", [dict, Substitution, UnionFindSubstitution])
+@pytest.mark.parametrize("size", [300, 1000])
+def test_unify_var_chain(size, s_type, benchmark):
+    lvars = vars(size)
+
+    def _unify_var_chain():
+        # Build a `size`-long chain of variables and then bind every one of
+        # them, which walks the chain from each variable.
+        s = unify(lvars[:-1], lvars[1:], s_type())
+        return unify(lvars, ["a"] * size, s)
+
+    res = benchmark(_unify_var_chain)
+    assert reify(lvars[0], res) == "a"
+
+
+@pytest.mark.benchmark(group="unify_flat")
+@pytest.mark.parametrize("s_type", [dict, ArraySubstitution])
+@pytest.mark.parametrize("size", [1000, 10000])
+def test_unify_flat(size, s_type, benchmark):
+    lvars = [IndexedVar() for i in range(size)]
+    term = list(range(size))
+
+    res = benchmark(unify, lvars, term, s_type())
+    assert res[lvars[-1]] == size - 1
+
+
+@pytest.mark.benchmark(group="reify_ground_payload")
+@pytest.mark.parametrize("term_cache", [False, True])
+@pytest.mark.parametrize("size", [1000, 10000])
+def test_reify_ground_payload(size, term_cache, benchmark):
+    lvars = vars(5)
+    payload = tuple((i, str(i), (i, i + 1)) for i in range(size))
+    form = tuple((payload, lv) for lv in lvars)
+    s = {lv: i for i, lv in enumerate(lvars)}
+
+    if term_cache:
+        enable_term_cache()
+
+    try:
+        res = benchmark(reify, form, s)
+    finally:
+        disable_term_cache()
+
+    assert res == tuple((payload, i) for i in range(5))
+
+
+@pytest.mark.benchmark(group="unify_repeated_binding")
+@pytest.mark.parametrize("consed", [False, True])
+@pytest.mark.parametrize("size", [100, 1000])
+def test_unify_repeated_binding(size, consed, benchmark):
+    x = var()
+    cons = hashcons if consed else tuple
+
+    def gen_term():
+        return cons([(i, (str(i), [i + 1])) for i in range(size)])
+
+    u = (x,) * 100
+    v = tuple(gen_term() for _ in range(100))
+
+    res = benchmark(unify, u, v, {})
+    assert res[x] == gen_term()
+
+
+@pytest.mark.benchmark(group="normalize")
+@pytest.mark.parametrize("reverse", [False, True])
+@pytest.mark.parametrize("size", [1000, 4000])
+def test_normalize(size, reverse, benchmark):
+    lvars = vars(size + 1)
+    # Each binding depends on the next one, so the keys are either in reverse
+    # dependency order or in dependency order.
+    idx = reversed(range(size)) if reverse else range(size)
+    s = {lvars[i]: (i, lvars[i + 1]) for i in idx}
+
+    res = benchmark(normalize, s)
+    assert reify(lvars[0], res)[0] == 0
+
+
+@pytest.mark.benchmark(group="unify_occurs_check")
+@pytest.mark.parametrize("occurs_check", [False, True])
+@pytest.mark.parametrize("size", [100, 1000])
+def test_unify_occurs_check(size, occurs_check, benchmark):
+    lvars = vars(size)
+    payload = tuple((i, str(i)) for i in range(size))
+    term = [(i, payload, lv) for i, lv in enumerate(lvars[1:])] + [payload]
+
+    res = benchmark(unify, lvars, term, {}, occurs_check=occurs_check)
+    assert res[lvars[-1]] is payload
+
+
+@pytest.mark.benchmark(group="unify_occurs_check_chain")
+@pytest.mark.parametrize("occurs_check", [False, True])
+@pytest.mark.parametrize("size", [1000, 4000])
+def test_unify_occurs_check_chain(size, occurs_check, benchmark):
+    lvars = vars(size)
+    u = lvars[-2::-1]
+    v = [(lv,) for lv in lvars[:0:-1]]
+
+    res = benchmark(unify, u, v, UnionFindSubstitution(), occurs_check=occurs_check)
+    assert len(res) == size - 1
+
+
+@pytest.mark.benchmark(group="unify_mismatch")
+@pytest.mark.parametrize("size", [100, 1000])
+def test_unify_head_mismatch(size, benchmark):
+    lvars = vars(size)
+    u = (tuple(lvars), "add", lvars[0])
+    v = (tuple(range(size)), "mul", 1)
+
+    res = benchmark(unify, u, v, {})
+    assert res is False
+
+
+@pytest.mark.benchmark(group="unify_mismatch")
+@pytest.mark.parametrize("fail_fast", [False, True])
+@pytest.mark.parametrize("size", [100, 1000])
+def test_unify_tail_mismatch(size, fail_fast, benchmark):
+    lvars = vars(size)
+    u = [(lv, (lv, i)) for i, lv in enumerate(lvars)] + ["add"]
+    v = [(i, (i, i)) for i in range(size)] + ["mul"]
+
+    res = benchmark(unify, u, v, {}, fail_fast=fail_fast)
+    assert res is False
+
+
+def unify_in_steps(u, v, s, max_steps):
+    try:
+        return unify(u, v, s, max_steps=max_steps)
+    except StepLimitExceeded as e:
+        cont = e.continuation
+
+    while True:
+        try:
+            return cont.resume(max_steps)
+        except StepLimitExceeded:
+            pass
+
+
+@pytest.mark.benchmark(group="unify_max_steps")
+@pytest.mark.parametrize("max_steps", [None, 100, 10000])
+def test_unify_max_steps(max_steps, benchmark):
+    a_lv = var()
+    form, lvars = gen_long_chain(a_lv, 5000, use_lvars=True)
+    term, _ = gen_long_chain("a", 5000)
+
+    res = benchmark(unify_in_steps, form, term, {}, max_steps)
+    assert res[a_lv] == "a"
+
+
+def rename_with_reify(pattern, lvars):
+    return reify(pattern, {lv: var() for lv in lvars})
+
+
+@pytest.mark.benchmark(group="rename_apart")
+@pytest.mark.parametrize("rename", ["reify", "rename_apart"])
+def test_rename_apart(rename, benchmark):
+    lvars = vars(10)
+    ground = tuple(range(50))
+    pattern = tuple((lv, ground, (i, lv)) for i, lv in enumerate(lvars * 10))
+
+    if rename == "reify":
+        res = benchmark(rename_with_reify, pattern, lvars)
+    else:
+        res = benchmark(rename_apart, pattern)
+
+    assert res[0][0] not in lvars
+    assert res[0][1] is ground
+
+
+@pytest.mark.benchmark(group="isvar")
+@pytest.mark.parametrize("func", [isvar, isvar_strict])
+def test_isvar(func, benchmark):
+    objs = [var(), 1, "a", (1, 2), [1, 2], {1: 2}, IndexedVar()] * 100
+
+    res = benchmark(lambda: [func(o) for o in objs])
+    assert sum(res) == 200
+
+
+@pytest.mark.benchmark(group="variables_scope")
+@pytest.mark.parametrize("outer_size", [10, 10000])
+def test_variables_scope(outer_size, benchmark):
+    def enter_inner():
+        with variables("a", "b"):
+            return isvar("a")
+
+    with variables(*range(outer_size)):
+        assert benchmark(enter_inner)
+
+
+@pytest.mark.benchmark(group="var_alloc")
+@pytest.mark.parametrize("ctor", [var, fresh])
+def test_var_alloc(ctor, benchmark):
+    res = benchmark(lambda: [ctor() for _ in range(10000)])
+    assert len(res) == 10000
+
+
+@pytest.mark.benchmark(group="var_alloc_threads")
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_var_alloc_threads(n_threads, benchmark):
+    def alloc():
+        with ThreadPoolExecutor(n_threads) as pool:
+            res = list(pool.map(lambda _: vars(10000 // n_threads), range(n_threads)))
+        return [lv for lvars in res for lv in lvars]
+
+    res = benchmark(alloc)
+    assert len({lv.token for lv in res}) == len(res)
+
+
+@pytest.mark.parametrize("ctor", [var, fresh])
+def test_var_memory(ctor, benchmark):
+    def measure(n=10000):
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            lvars = [ctor() for _ in range(n)]
+            size = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        del lvars
+        return size / n
+
+    size = benchmark.pedantic(measure, rounds=1, iterations=1)
+    benchmark.extra_info["bytes_per_var"] = size
+    assert size < (100 if ctor is fresh else 1000)
+
+
+def gen_dag(depth, leaf):
+    t = leaf
+    for i in range(depth):
+        t = (t, t, i)
+    return t
+
+
+@pytest.mark.benchmark(group="unify_dag")
+@pytest.mark.parametrize("dag", [False, True])
+@pytest.mark.parametrize("depth", [10, 15])
+def test_unify_dag(depth, dag, benchmark):
+    x, y = var(), var()
+    u = gen_dag(depth, (x, 1))
+    v = gen_dag(depth, (2, y))
+
+    res = benchmark(unify, u, v, {}, dag=dag)
+    assert res == {x: 2, y: 1}
+
+
+@pytest.mark.benchmark(group="reify_dag")
+@pytest.mark.parametrize("dag", [False, True])
+@pytest.mark.parametrize("depth", [10, 15])
+def test_reify_dag(depth, dag, benchmark):
+    x = var()
+    e = gen_dag(depth, (x, 1))
+
+    res = benchmark(reify, e, {x: 2}, dag=dag)
+    assert res[0][0] == res[1][0]
+
+
 @pytest.mark.skipif(
     platform.python_implementation() == "PyPy",
     reason="PyPy's sys.getrecursionlimit changes",
@@ -0,0 +1,133 @@
+from collections.abc import Mapping
+
+import pytest
+
+from tests.utils import registered
+from unification import var
+from unification.cache import (
+    IdentityCache,
+    disable_term_cache,
+    enable_term_cache,
+    get_term_cache,
+)
+from unification.core import _unify, isground, reify, unground_lvars, unify
+from unification.more import unifiable
+
+
+@unifiable
+class Foo(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.a == other.a
+
+
+@pytest.fixture
+def term_cache():
+    cache = enable_term_cache()
+    yield cache
+    disable_term_cache()
+
+
+def test_IdentityCache():
+    cache = IdentityCache(maxsize=2)
+    a, b, c = [1], [2], [3]
+
+    cache.set(a, "a")
+    cache.set(b, "b")
+    assert cache.get(a) == "a"
+
+    cache.set(c, "c")
+    assert len(cache) == 2
+    assert cache.get(b) is None
+    assert cache.get(a) == "a"
+    assert cache.get(c) == "c"
+    assert cache.get([1], 0) == 0
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_term_cache_toggle():
+    assert get_term_cache() is None
+    cache = enable_term_cache(10)
+    assert get_term_cache() is cache
+    assert cache.maxsize == 10
+    disable_term_cache()
+    assert get_term_cache() is None
+
+
+def test_term_cache_reify(term_cache):
+    x, y = var(), var()
+    payload = tuple((i, str(i), (i,)) for i in range(100))
+    e = (payload, x, (payload, slice(1, y)), [payload, x])
+    s = {x: 1}
+
+    res = reify(e, s)
+    assert res == (payload, 1, (payload, slice(1, y)), [payload, 1])
+    assert res[0] is payload
+    assert res[2] is e[2]
+    assert term_cache.get(payload) == (True,)
+    assert term_cache.get(e[2]) == (False,)
+
+    assert reify(e, {x: 1, y: 2})[2] == (payload, slice(1, 2))
+
+    # Containers holding mutable or custom terms aren't considered ground
+    lst = [1]
+    assert reify((lst, (Foo(x),)), s) == ([1], (Foo(1),))
+    assert term_cache.get((lst,)) is None
+
+
+def test_term_cache_unify(term_cache):
+    x = var()
+    payload = tuple(range(100))
+
+    assert unify((payload, x), (tuple(range(100)), 1), {}) == {x: 1}
+    assert unify((payload, x), (tuple(range(1, 101)), 1), {}) is False
+    assert unify(((x,), payload), ((1,), payload), {}) == {x: 1}
+
+
+def test_term_cache_lvars(term_cache):
+    x, y, z = var(), var(), var()
+    payload = tuple(range(100))
+    e = (payload, (x, [y]), (Foo(z), slice(x, 1)))
+
+    assert unground_lvars(e, {}) == {x, y, z}
+    # Only the variables of entirely immutable terms are cached
+    assert term_cache.get(e) == (False, None)
+    assert unground_lvars(e[2][1], {}) == {x}
+    assert term_cache.get(e[2][1]) == (False, frozenset({x}))
+    assert unground_lvars(e, {x: 1}) == {y, z}
+    assert unground_lvars(e, {x: (y,), y: 2}) == {z}
+    assert unground_lvars(payload, {}) == set()
+
+    assert isground(payload, {})
+    assert not isground(e, {x: 1})
+    assert isground(e, {x: 1, y: 2, z: 3})
+    assert not isground(e, {x: 1, y: 2, z: (3, var())})
+
+
+def test_term_cache_mutable_elements(term_cache):
+    x, y = var(), var()
+    lst = [x]
+    t = (lst, 1)
+
+    assert unground_lvars(t, {}) == {x}
+
+    lst[0] = y
+    assert unground_lvars(t, {}) == {y}
+    assert not isground(t, {x: 1})
+    assert isground(t, {y: 1})
+
+
+def test_term_cache_custom_atoms(term_cache):
+    class Any_(object):
+        pass
+
+    a, b = Any_(), Any_()
+
+    with registered(_unify, (Any_, Any_, Mapping), lambda u, v, s: s):
+        assert unify((a, 1), (b, 1), {}) == {}
+        assert unify((a, 1), (b, 2), {}) is False
+        assert reify((a, 1), {var(): 1})[0] is a
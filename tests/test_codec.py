@@ -0,0 +1,150 @@
+import pickle
+import sys
+from collections import OrderedDict
+
+import pytest
+
+from tests.utils import gen_long_chain
+from unification import var
+from unification.codec import dumps, loads
+from unification.substitution import (
+    FrozenSubstitution,
+    NormalizedSubstitution,
+    Substitution,
+)
+from unification.variable import IndexedVar, Var, fresh, isvar
+
+
+class Foo(object):
+    def __init__(self, a):
+        self.a = a
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.a == other.a
+
+
+def test_pickle_var():
+    x, y, i = var(), var("y"), IndexedVar()
+
+    res = pickle.loads(pickle.dumps((x, y, i, x)))
+    assert res[0] is x
+    assert res[1] is y
+    assert res[2] is i
+    assert res[3] is x
+
+    # Fresh variables created after restoring a variable with a (foreign)
+    # generated token can't be mistaken for it.
+    token = f"_{Var._id + 10}"
+    data = pickle.dumps(Var(token))
+    z = pickle.loads(data)
+    assert z.token == token
+    assert all(var() is not z for i in range(20))
+
+    # Non-decimal digits aren't mistaken for a count.
+    z = var("a_\u00b2")
+    assert pickle.loads(pickle.dumps(z)) is z
+
+
+def test_codec_roundtrip():
+    x, y, i = var(), var("y"), IndexedVar()
+    terms = [
+        None,
+        True,
+        False,
+        0,
+        -1,
+        2**100,
+        -(2**100),
+        1.5,
+        1 + 2j,
+        "",
+        "abc\udc80",
+        b"abc",
+        (),
+        [],
+        {},
+        (1, "a", [x, (y, i)], {x: [1, 2.0], "b": None}),
+        {1, 2, "a"},
+        frozenset({x, 1}),
+        slice(1, x, None),
+        OrderedDict([(2, 1), (1, 2)]),
+        Foo((x, 1)),
+    ]
+    for t in terms:
+        res = loads(dumps(t))
+        assert type(res) is type(t)
+        assert res == t
+
+    assert loads(dumps(x)) is x
+    assert loads(dumps(i)) is i
+    assert loads(dumps(True)) is True
+
+
+def test_codec_substitution():
+    x, y = var(), var()
+    for s in (
+        {x: (1, y), y: [x]},
+        Substitution({x: 1, y: (x,)}),
+        NormalizedSubstitution({x: 1}),
+        FrozenSubstitution({x: 1}),
+    ):
+        res = loads(dumps(s))
+        assert type(res) is type(s)
+        assert res == s
+
+
+def test_codec_sharing():
+    x = var()
+    sub = [x, ("a", "b")]
+    t = (sub, sub, (sub, [sub]))
+
+    data = dumps(t)
+    res = loads(data)
+    assert res == t
+    assert res[0] is res[1]
+    assert res[2][0] is res[0]
+    assert res[2][1][0] is res[0]
+
+    # Shared subterms are only encoded once
+    assert len(dumps((sub,) * 100)) < len(
+        dumps(tuple([x, ("a", "b")] for i in range(100)))
+    )
+
+    cyclic = [1]
+    cyclic.append(cyclic)
+    with pytest.raises(ValueError):
+        dumps(cyclic)
+
+
+def test_codec_deep():
+    a_lv = var()
+    n = sys.getrecursionlimit() * 2
+    t, _ = gen_long_chain(a_lv, n)
+
+    res = loads(dumps(t))
+    for i in range(n - 1):
+        assert res[0] == t[0]
+        res, t = res[1], t[1]
+    assert res is a_lv
+
+
+def test_codec_errors():
+    with pytest.raises(ValueError):
+        loads(b"xx")
+
+    with pytest.raises(ValueError):
+        loads(b"U\x01\xff")
+
+    with pytest.raises(ValueError):
+        loads(b"U\x01\x00\x00")
+
+
+def test_codec_AnonVar():
+    x, y = fresh(), fresh()
+    res = loads(dumps((x, [x, y], {x: y})))
+
+    assert isvar(res[0])
+    assert res[0] is not x
+    assert res[0] is res[1][0]
+    assert res[1][1] is not res[0]
+    assert res[2] == {res[0]: res[1][1]}
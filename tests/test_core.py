@@ -4,9 +4,31 @@ from types import MappingProxyType
 
 import pytest
 
-from tests.utils import gen_long_chain
-from unification import var
-from unification.core import assoc, isground, reify, unground_lvars, unify
+from tests.utils import gen_long_chain, registered
+from unification import core, isvar, var, variables, vars
+from unification.core import (
+    StepLimitExceeded,
+    assoc,
+    fingerprint,
+    isground,
+    normalize,
+    occurs,
+    reify,
+    rename_apart,
+    unground_lvars,
+    unify,
+    unify_inplace,
+)
+from unification.hashcons import hashcons
+from unification.more import unifiable
+from unification.substitution import (
+    ArraySubstitution,
+    LayeredSubstitution,
+    NormalizedSubstitution,
+    Substitution,
+    TrailSubstitution,
+    UnionFindSubstitution,
+)
 from unification.utils import freeze
 
 
@@ -78,6 +100,75 @@ def test_reify_slice():
     assert reify(slice(1, x, 3), {x: 10}) == slice(1, 10, 3)
 
 
+def test_normalize():
+    x, y, z, w = var(), var(), var(), var()
+    s = {x: (1, y), y: [z, w], z: 2, w: z}
+
+    ns = normalize(s)
+    assert isinstance(ns, NormalizedSubstitution)
+    assert ns == {x: (1, [2, 2]), y: [2, 2], z: 2, w: 2}
+    assert list(ns) == list(s)
+    assert normalize(ns) is ns
+
+    e = (x, {3: y}, w, var("q"))
+    assert reify(e, ns) == reify(e, s)
+    assert unground_lvars(e, ns) == {var("q")}
+    assert not isground(e, ns)
+    assert isground(e[:3], ns)
+
+    assert normalize({x: y}) == {x: y}
+    assert normalize({}) == {}
+
+    with pytest.raises(ValueError):
+        normalize({x: (1, y), y: [x]})
+
+    with pytest.raises(ValueError):
+        normalize({x: x})
+
+    # Long variable chains are handled without recursion
+    n = sys.getrecursionlimit() * 2
+    lvars = [var() for i in range(n)]
+    s = dict(zip(lvars[:-1], lvars[1:]))
+    s[lvars[-1]] = "a"
+    assert all(v == "a" for v in normalize(s).values())
+
+    # Bindings in reverse dependency order are only resolved once each
+    lvars = [var() for i in range(n + 1)]
+    s = {lvars[i]: (i, lvars[i + 1]) for i in reversed(range(n))}
+    ns = normalize(s)
+    assert list(ns) == list(s)
+    assert ns[lvars[n - 2]] == (n - 2, (n - 1, lvars[n]))
+    assert ns[lvars[0]][1] is ns[lvars[1]]
+
+
+def test_reify_sharing():
+    from unification.core import _reify, stream_eval
+
+    x, y = var(), var()
+    s = {x: 1}
+    ground = (1, [2, {3: (4,)}], {5, 6}, slice(1, 2))
+    e = [ground, (y, ground[1]), {"a": x}, slice(y, 1)]
+
+    res = reify(e, s)
+    assert res == [ground, (y, ground[1]), {"a": 1}, slice(y, 1)]
+    assert res is not e
+    assert res[0] is ground
+    assert res[1] is e[1]
+    assert res[2] is not e[2]
+    assert res[3] is e[3]
+
+    for t in (e[1], e[3]):
+        assert stream_eval(_reify(t, {y: 2})) is not t
+    for t in (e[0], e[1], e[3]):
+        assert stream_eval(_reify(t, s)) is t
+    assert stream_eval(_reify(e[2], s)) == {"a": 1}
+
+    it = iter([1, 2])
+    res = reify(it, s)
+    assert res is not it
+    assert list(res) == [1, 2]
+
+
 def test_unify():
     x, y, z = var(), var(), var()
     assert unify(x, x, {}) == {}
@@ -96,6 +187,363 @@ def test_unify():
     assert unify(x, y, {y: z}) == {y: z, x: z}
 
 
+def test_unify_inplace():
+    x, y = var(), var()
+    s = TrailSubstitution({y: 1})
+
+    assert unify_inplace((x, y, 3), (2, 1, 4), s) is False
+    assert s == {y: 1}
+
+    assert unify_inplace([x, [y, 3]], [2, [1, 4]], s) is False
+    assert s == {y: 1}
+
+    assert unify_inplace((x, y), (2, 1), s) is s
+    assert s == {x: 2, y: 1}
+
+
+@unifiable
+class Node(object):
+    def __init__(self, a):
+        self.a = a
+
+
+def test_occurs():
+    x, y, z = var(), var(), var()
+
+    assert occurs(x, x, {})
+    assert occurs(x, (1, [2, {3: x}]), {})
+    assert occurs(x, (1, y), {y: [z], z: (x,)})
+    assert not occurs(x, (1, y), {y: [z]})
+    assert not occurs(x, 1, {x: 1})
+    assert occurs(x, Node((1, x)), {})
+
+
+@pytest.mark.parametrize(
+    "s_type",
+    [
+        dict,
+        Substitution,
+        LayeredSubstitution,
+        TrailSubstitution,
+        UnionFindSubstitution,
+        ArraySubstitution,
+    ],
+)
+def test_unify_occurs_check(s_type):
+    x, y, z = var(), var(), var()
+
+    assert unify(x, (1, x), s_type()) == {x: (1, x)}
+    assert unify(x, (1, x), s_type(), occurs_check=True) is False
+    assert unify((1, x), x, s_type(), occurs_check=True) is False
+    assert unify((x, y), (y, [x]), s_type(), occurs_check=True) is False
+    assert unify((x, y, z), ((1, y), (2, z), [x]), s_type(), occurs_check=True) is False
+    assert unify(x, (1, y), s_type({y: (2, x)}), occurs_check=True) is False
+    assert unify([x, Node(x)], [y, Node((1, y))], s_type(), occurs_check=True) is False
+
+    assert unify(x, x, s_type(), occurs_check=True) == {}
+    assert unify((x, y), (y, x), s_type(), occurs_check=True) == {x: y}
+    assert unify((x, y), ((1, y), (2, z)), s_type(), occurs_check=True) == {
+        x: (1, y),
+        y: (2, z),
+    }
+    assert unify(Node(x), Node((1, y)), s_type(), occurs_check=True) == {x: (1, y)}
+    assert (
+        unify((y, x, Node(z)), (3, (1, z), Node((2, x))), s_type(), occurs_check=True)
+        is False
+    )
+
+    # The variables reached by earlier bindings are reused when they're extended.
+    lvars = vars(10)
+    u, v = lvars[:-1], [(lv,) for lv in lvars[1:]]
+    assert unify(u[::-1], v[::-1], s_type(), occurs_check=True)
+    assert unify(u + [lvars[-1]], v + [(lvars[0],)], s_type(), occurs_check=True) is (
+        False
+    )
+
+
+def test_unify_occurs_check_default(monkeypatch):
+    x = var()
+
+    monkeypatch.setattr(core, "default_occurs_check", True)
+    assert unify(x, (1, x), {}) is False
+    assert unify(x, (1, x)) is False
+    assert unify(x, (1, x), {}, delta=True) is False
+    assert unify(x, (1, x), {}, occurs_check=False) == {x: (1, x)}
+
+    s = TrailSubstitution()
+    assert unify_inplace((1, x), (1, (2, x)), s) is False
+    assert s == {}
+
+
+def gen_dag(depth, leaf):
+    t = leaf
+    for i in range(depth):
+        t = (t, [t, i], {"a": t})
+    return t
+
+
+def test_unify_dag():
+    x, y = var(), var()
+
+    assert unify(gen_dag(40, (x, 1)), gen_dag(40, (2, y)), {}, dag=True) == {
+        x: 2,
+        y: 1,
+    }
+    assert unify(gen_dag(40, (x, 1)), gen_dag(40, (2, 3)), {}, dag=True) is False
+    assert unify(gen_dag(40, x), gen_dag(41, y), {}, dag=True) is False
+    assert unify((gen_dag(40, x), x), (gen_dag(40, 1), 2), {}, dag=True) is False
+    assert unify(gen_dag(3, x), gen_dag(3, 1), {}, dag=True) == {x: 1}
+    assert unify(gen_dag(3, x), gen_dag(3, 1), {}) == {x: 1}
+
+    a = gen_dag(40, (x, 1))
+    assert unify(a, a, {}, dag=True) == {}
+    assert unify((a, x), (gen_dag(40, (y, 1)), 2), {}, dag=True) == {x: y, y: 2}
+
+
+def test_reify_dag():
+    x = var()
+
+    res = reify(gen_dag(40, (x, 1)), {x: 2}, dag=True)
+    assert res[0] is res[1][0]
+    assert res[0] is res[2]["a"]
+
+    small = reify(gen_dag(3, (x, 1)), {x: 2}, dag=True)
+    assert small == gen_dag(3, (2, 1))
+    assert small == reify(gen_dag(3, (x, 1)), {x: 2})
+
+    a = gen_dag(40, 1)
+    assert reify(a, {x: 2}, dag=True) is a
+
+
+def test_fingerprint():
+    x = var()
+
+    assert fingerprint(x) is None
+    assert fingerprint(1) is None
+    assert fingerprint({1: x}) is None
+    assert fingerprint((1, x, "a", 2))[:3] == (tuple, 4, 1)
+    assert fingerprint([1, x]) != fingerprint((1, x))
+    assert fingerprint((1, (2,), [3]), k=1) == (tuple, 3, 1)
+    assert fingerprint((1, (2,), [x], {})) == (tuple, 4, 1, tuple, list)
+    assert fingerprint(hashcons((1, 2))) == fingerprint((1, 2))
+
+    with variables(1):
+        assert fingerprint((1, 2)) == fingerprint((x, 2))
+
+
+@pytest.mark.parametrize("min_size", [0, None])
+def test_unify_fingerprint(min_size, monkeypatch):
+    if min_size is not None:
+        monkeypatch.setattr(core, "fingerprint_min_size", min_size)
+
+    x, y = var(), var()
+    deep, _ = gen_long_chain(x, 5000)
+
+    assert unify((deep, 1), (deep, 2), {}) is False
+    assert unify((1, deep), (1.0, gen_long_chain(2, 5000)[0]), {}) == {x: 2}
+    assert unify((x, 1), (y, True), {}) == {x: y}
+    assert unify((deep, x), (gen_long_chain(1, 5000)[0], 2), {}) is False
+    assert unify([x, "a"], [1, "b"], {}) is False
+    assert unify([x, "a"], (1, "a"), {}) is False
+    assert unify(["a", (x,), [1]], ["a", (1,), (1,)], {}) is False
+    assert unify(["a", (x,), [1]], ["a", hashcons((1,)), [1]], {}) == {x: 1}
+    assert unify([(x,), 2], [hashcons([1]), 3], {}) is False
+    assert unify(hashcons((1, 2)), hashcons((1, 2)), {}) == {}
+
+    nan = float("nan")
+    assert unify((nan, x), (nan, 1), {}) == {x: 1}
+
+    long_u = (x,) + tuple(range(1, 20))
+    assert unify(long_u, (0,) + tuple(range(1, 20)), {}) == {x: 0}
+    assert unify(long_u, (0, 2) + tuple(range(2, 20)), {}) is False
+    assert unify(long_u, [0] + list(range(1, 20)), {}) is False
+
+
+def test_unify_fail_fast():
+    x, y, z = var(), var(), var()
+    deep, _ = gen_long_chain(x, 5000)
+    deep_2, _ = gen_long_chain(1, 5000)
+
+    cases = [
+        ((x, x), (y, 1)),
+        ((x, y, x), (y, x, 1)),
+        ((x, (y, [1, z]), z), ((1, 2), (x, [1, 3]), 3)),
+        ((deep, [x, 1]), (deep_2, [y, 2])),
+        ((deep, x, 1), (deep_2, y, 1)),
+        ([deep, x, (y,)], [deep_2, 2, [3]]),
+        ({1: deep, 2: x}, {1: deep_2, 2: 3}),
+        ({1: deep, 2: 3}, {1: deep_2, 2: 4}),
+        ({1: deep, 2: x}, {1: deep_2, 3: x}),
+        ((x, y), (y, (1, x))),
+        (slice(x, 1), slice(2, 3)),
+        ((Node(x), 1), (Node(2), 1)),
+    ]
+
+    for u, v in cases:
+        for s in ({}, {y: 2}, {x: z}):
+            res = unify(u, v, s, fail_fast=True)
+            expected = unify(u, v, s)
+            assert res == expected
+            if res is not False:
+                assert list(res.items()) == list(expected.items())
+
+    assert unify(iter([x, 1]), iter([2, 1]), {}, fail_fast=True) == {x: 2}
+    assert unify(iter([x, 1]), iter([2, 2]), {}, fail_fast=True) is False
+    assert unify((deep, x, 1), (deep_2, 2, 2), {}, fail_fast=True) is False
+    assert unify((deep, x), (deep_2, 2), {x: 1}, fail_fast=True) is False
+    assert unify((deep, [x], 1), (deep_2, (2,), 1), {}, fail_fast=True) is False
+    assert unify((deep, [x]), (deep_2, [2, 3]), {}, fail_fast=True) is False
+    assert unify((deep, y), (deep_2, 2), {}, fail_fast=True, delta=True) == {
+        x: 1,
+        y: 2,
+    }
+
+
+def run_in_steps(func, *args, max_steps=1, **kwargs):
+    """Call `func` with a step budget, and resume it until it's finished."""
+    n = 0
+    try:
+        return func(*args, max_steps=max_steps, **kwargs), n
+    except StepLimitExceeded as e:
+        cont = e.continuation
+
+    while True:
+        n += 1
+        try:
+            return cont.resume(max_steps), n
+        except StepLimitExceeded as e:
+            assert e.continuation is cont
+
+
+def test_unify_max_steps():
+    x, y = var(), var()
+    deep, _ = gen_long_chain(x, 1000)
+    deep_2, _ = gen_long_chain(2, 1000)
+
+    res, n = run_in_steps(unify, (deep, y), (deep_2, 1), {}, max_steps=10)
+    assert res == {x: 2, y: 1}
+    assert n > 100
+
+    res, n = run_in_steps(unify, (deep, y), (deep_2, 1), {}, max_steps=1000)
+    assert res == {x: 2, y: 1}
+    assert 0 < n < 10
+
+    assert run_in_steps(unify, (deep, 2), (deep_2, 1), {})[0] is False
+    assert run_in_steps(unify, (deep, y), (deep_2, 1), {}, delta=True)[0] == {
+        x: 2,
+        y: 1,
+    }
+    assert unify((deep, y), (deep_2, 1), {}, max_steps=10000) == {x: 2, y: 1}
+
+    # `_unify` implementations in other modules are suspended, too
+    res, n = run_in_steps(unify, Node([deep, y]), Node([deep_2, 1]), {})
+    assert res == {x: 2, y: 1}
+    assert n > 1000
+
+    s = TrailSubstitution()
+    assert (
+        run_in_steps(unify_inplace, (y, deep), (1, gen_long_chain(1, 1000)), s)[0]
+        is False
+    )
+    assert s == {}
+
+    with pytest.raises(StepLimitExceeded) as exc:
+        unify((deep, y), (deep_2, 1), {}, max_steps=1)
+
+    cont = exc.value.continuation
+
+    with pytest.raises(ValueError):
+        cont.resume(0)
+
+    assert cont.resume() == {x: 2, y: 1}
+
+    for max_steps in (0, -1):
+        with pytest.raises(ValueError):
+            unify((deep, y), (deep_2, 1), {}, max_steps=max_steps)
+
+        with pytest.raises(ValueError):
+            unify(x, x, {}, max_steps=max_steps)
+
+
+def test_reify_max_steps():
+    x, y = var(), var()
+    deep, _ = gen_long_chain(x, 300)
+    s = {x: (1, y), y: 2}
+
+    expected, _ = gen_long_chain((1, 2), 300)
+    res, n = run_in_steps(reify, (deep, Node(deep)), s, max_steps=10)
+    assert res[0] == expected
+    assert res[1].a == expected
+    assert n > 100
+
+    res, n = run_in_steps(reify, (deep, deep), s, max_steps=10, dag=True)
+    assert res[0] == expected
+    assert res[0] is res[1]
+
+    with pytest.raises(ValueError):
+        reify(deep, s, max_steps=0)
+
+    with pytest.raises(ValueError):
+        reify(deep, {}, max_steps=-1)
+
+
+def test_rename_apart():
+    x, y = var(), var()
+    ground = (1, (2, "a"))
+    pattern = (x, ground, (y, x), slice(y, 2), frozenset([x]))
+
+    res = rename_apart(pattern)
+    new_x, new_y = res[0], res[2][0]
+
+    assert not ({new_x, new_y} & {x, y})
+    assert new_x is not new_y
+    assert res == (new_x, ground, (new_y, new_x), slice(new_y, 2), frozenset([new_x]))
+    assert res[1] is ground
+    assert unify(res, pattern, {}) == {new_x: x, new_y: y}
+
+    # The compiled renaming is reused, but the variables are new every time.
+    assert core._rename_templates.get(pattern) is not None
+    res_2 = rename_apart(pattern)
+    assert res_2[0] is not new_x
+    assert res_2[1] is ground
+
+    assert rename_apart(ground) is ground
+    assert rename_apart(x) is not x
+    assert rename_apart(x, new_var=var) != x
+
+    consed = hashcons((x, (1, 2)))
+    res = rename_apart(consed)
+    assert res is hashcons((res[0], (1, 2)))
+
+
+def test_rename_apart_mutable():
+    x, y = var(), var()
+    pattern = [x, {"a": (y, [1])}, Node((x, y))]
+
+    res = rename_apart(pattern)
+    new_x, new_y = res[0], res[1]["a"][0]
+
+    assert res == [new_x, {"a": (new_y, [1])}, res[2]]
+    assert res[1]["a"][1] is pattern[1]["a"][1]
+    assert res[2].a == (new_x, new_y)
+
+    # Terms with mutable parts are compiled every time.
+    assert core._rename_templates.get(pattern) is None
+    pattern[0] = 1
+    assert rename_apart(pattern)[0] == 1
+
+    with variables("a"):
+        pattern = ("a", 1)
+        assert isvar(rename_apart(pattern)[0])
+    assert rename_apart(pattern) is pattern
+
+    # A renaming cached outside of a scope isn't used within one.
+    pattern = tuple(["b", 1])
+    assert rename_apart(pattern) is pattern
+    with variables("b"):
+        assert isvar(rename_apart(pattern)[0])
+
+
 def test_unify_slice():
     x, y = var(), var()
     assert unify(slice(1), slice(1), {}) == {}
@@ -256,6 +704,27 @@ def test_unify_recursion_limit():
     assert s[a_lv] == "a"
 
 
+def test_unify_dispatch_override():
+    from collections.abc import Mapping
+
+    from unification.core import _unify
+
+    class WildTuple(tuple):
+        """A tuple that unifies with any other `WildTuple`."""
+
+    def _unify_WildTuple(u, v, s):
+        yield s
+
+    x = var()
+
+    with registered(_unify, (WildTuple, WildTuple, Mapping), _unify_WildTuple):
+        assert unify(WildTuple((1, 2)), WildTuple((3,)), {}) == {}
+        assert unify((x, [WildTuple((1,)), 2]), (1, [WildTuple(()), 2]), {}) == {x: 1}
+        assert unify((x, [WildTuple((1,)), 2]), (1, [WildTuple(()), 3]), {}) is False
+
+    assert unify(WildTuple((1, 2)), WildTuple((3,)), {}) is False
+
+
 def test_unify_freeze():
 
     # These will sometimes be in different orders after conversion to
@@ -0,0 +1,86 @@
+from collections.abc import Mapping, Sequence
+
+import pytest
+
+from unification.dispatch import Dispatcher, dispatch
+
+
+def test_Dispatcher():
+    f = Dispatcher("f")
+
+    @f.register(object, object)
+    def f_object(x, y):
+        return "object"
+
+    @f.register(int, (int, str))
+    def f_int(x, y):
+        return "int"
+
+    @f.register(Sequence, object)
+    def f_seq(x, y):
+        return "seq"
+
+    assert f_int(1, 2) == "int"
+    assert f(1, 2) == "int"
+    assert f(1, "a") == "int"
+    assert f(True, 2) == "int"
+    assert f(1, 2.0) == "object"
+    assert f((1,), 2) == "seq"
+    assert f([1], 2) == "seq"
+    assert f.dispatch(int, int) is f_int
+    assert f.dispatch(list, float) is f_seq
+
+    with pytest.raises(NotImplementedError):
+        f(1)
+
+    assert f.dispatch(int) is None
+    assert repr(f) == "<dispatched f>"
+
+
+def test_Dispatcher_cache():
+    f = Dispatcher("f")
+    f.add((object,), lambda x: "object")
+
+    assert f(1) == "object"
+
+    # Adding an implementation clears the cached resolutions
+    f.add((int,), lambda x: "int")
+    assert f(1) == "int"
+    assert f("a") == "object"
+
+    # The most recently registered signature wins in ambiguous cases
+    class A(object):
+        pass
+
+    f.add((A, object), lambda x, y: "A-object")
+    f.add((object, A), lambda x, y: "object-A")
+    assert f(A(), A()) == "object-A"
+
+
+def test_Dispatcher_kwargs():
+    f = Dispatcher("f")
+
+    @f.register(int, int, Mapping)
+    def f_int(x, y, z, w=1):
+        return x + y + w
+
+    assert f(1, 2, {}, w=3) == 6
+
+
+def test_dispatch():
+    namespace = {}
+
+    @dispatch(int, namespace=namespace)
+    def g(x):
+        """A docstring."""
+        return "int"
+
+    @dispatch(str, namespace=namespace)
+    def g(x):  # noqa: F811
+        return "str"
+
+    assert namespace["g"] is g
+    assert isinstance(g, Dispatcher)
+    assert g.__doc__ == "A docstring."
+    assert g(1) == "int"
+    assert g("a") == "str"
@@ -0,0 +1,135 @@
+import gc
+import pickle
+from copy import copy, deepcopy
+
+import pytest
+
+from unification import var
+from unification.core import isground, reify, unground_lvars, unify
+from unification.hashcons import HashConsedTuple, HashConsTable, hashcons
+
+
+def test_hashcons():
+    x = var()
+    a = hashcons((1, [x, "a"], (2, 3), slice(1, x)))
+    b = hashcons([1, (x, "a"), [2, 3], slice(1, x)])
+
+    assert type(a) is HashConsedTuple
+    assert a is b
+    assert a[1] is b[1]
+    assert a[3] is b[3]
+    assert a == (1, (x, "a"), (2, 3), slice(1, x))
+    assert hash(a[1]) == hash((x, "a"))
+    assert hashcons(a) is a
+
+    assert not a.ground
+    assert a[2].ground
+    assert hashcons(((),)).ground
+
+    # Atoms are compared by type and value
+    assert hashcons((1,)) is not hashcons((1.0,))
+    assert hashcons((1,)) == hashcons((1.0,))
+    assert hashcons((True,)) is not hashcons((1,))
+
+    # Unhashable atoms are compared by identity
+    d = {1: 2}
+    c = hashcons((d,))
+    assert hashcons((d,)) is c
+    assert hashcons(({1: 2},)) is not c
+    assert not c.ground
+    with pytest.raises(TypeError):
+        hash(c)
+
+    # Terms other than tuples, lists and slices are left as they are
+    assert hashcons(d) is d
+    assert hashcons(x) is x
+
+    cyclic = [1]
+    cyclic.append(cyclic)
+    with pytest.raises(ValueError):
+        hashcons(cyclic)
+
+
+def test_hashcons_copy():
+    x = var()
+    a = hashcons((1, (x, 2)))
+
+    assert copy(a) is a
+    assert deepcopy(a) is a
+    assert pickle.loads(pickle.dumps(a)) is a
+
+
+def test_HashConsTable():
+    table = HashConsTable(maxsize=2, slice_maxsize=1)
+
+    a = table.cons((1, (2,)))
+    assert type(a) is HashConsedTuple
+    assert len(table) == 2
+
+    # The table is full, so new tuples aren't hash-consed
+    b = table.cons((3, (2,)))
+    assert type(b) is tuple
+    assert b[1] is a[1]
+    assert table.cons((1, (2,))) is a
+
+    # The tuples are referenced weakly
+    del a, b
+    gc.collect()
+    assert len(table) == 0
+    assert type(table.cons((3, (2,)))) is HashConsedTuple
+
+    s1 = table.cons(slice(1, 2))
+    assert table.cons(slice(1, 2)) is s1
+    table.cons(slice(2, 3))
+    assert table.cons(slice(1, 2)) is not s1
+    assert table.cons(slice(1, 2)) == s1
+
+
+def test_hashcons_unify():
+    x, y = var(), var()
+    a = hashcons(tuple(range(10)))
+
+    assert unify(a, hashcons(tuple(range(1, 11))), {}) is False
+    assert unify(a, hashcons(list(range(10))), {}) == {}
+    assert unify(a, tuple(range(10)), {}) == {}
+    assert unify(hashcons((x, a)), hashcons((1, y)), {}) == {x: 1, y: a}
+    assert unify((x, x), (a, hashcons(list(range(10)))), {}) == {x: a}
+    assert unify((x, x), (a, hashcons(tuple(range(1, 11)))), {}) is False
+
+    # Distinct, but equal, hash-consed terms unify like tuples.
+    b, c = hashcons((1, 2)), hashcons((1.0, 2))
+    assert b is not c
+    assert b == c == (1, 2) and not b != c
+    assert unify(b, c, {}) == {}
+    assert unify((x, x), (b, c), {}) == {x: b}
+    assert unify(b, hashcons((1, 3)), {}) is False
+
+
+def test_hashcons_reify():
+    x, y = var(), var()
+    a = hashcons((1, (2, 3), (x, (4, y))))
+
+    res = reify(a, {x: 5})
+    assert type(res) is HashConsedTuple
+    assert res is hashcons((1, (2, 3), (5, (4, y))))
+    assert res[1] is a[1]
+    assert reify(a[1], {x: 5}) is a[1]
+
+    # Only the hash-consed tuples of the term are rebuilt; the values of the
+    # variables are used as they are.
+    s = {x: 5, y: [6]}
+    res = reify(a, s)
+    assert res == (1, (2, 3), (5, (4, [6])))
+    assert type(res[2][1]) is HashConsedTuple
+    assert res[2][1][1] is s[y]
+    assert reify(a, s) is res
+
+    res = reify(hashcons((x, 1)), {x: [1, 2]})
+    assert res == ([1, 2], 1)
+    assert type(res[0]) is list
+    assert unify(res, ([1, 2], 1), {}) == {}
+
+    assert isground(a[1], {})
+    assert not isground(a, {x: 5})
+    assert isground(a, {x: 5, y: 6})
+    assert unground_lvars(a, {x: 5}) == {y}
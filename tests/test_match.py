@@ -151,3 +151,34 @@ def test_VarDispatcher():
         return z
 
     assert d((1, 3), 2) == 3
+
+
+def test_dispatcher_fingerprints(monkeypatch):
+    from unification import match as match_module
+
+    calls = []
+    unify_inplace = match_module.unify_inplace
+
+    def counting_unify_inplace(u, v, s):
+        calls.append(v)
+        return unify_inplace(u, v, s)
+
+    monkeypatch.setattr(match_module, "unify_inplace", counting_unify_inplace)
+
+    x = var()
+    d = Dispatcher("d")
+    d.add(("inc", x), foo)
+    d.add(("dec", x), foo)
+    d.add(((1, x), 2), foo)
+
+    assert d("dec", 1) == ("dec", 1)
+    assert calls == [("dec", x)]
+
+    del calls[:]
+    assert d((1, 3), 2) == ((1, 3), 2)
+    assert calls == [((1, x), 2)]
+
+    del calls[:]
+    with raises(NotImplementedError):
+        d("mul", 1)
+    assert calls == []
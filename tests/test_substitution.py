@@ -0,0 +1,452 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from unification import IndexedVar, var
+from unification.codec import loads
+from unification.core import assoc, reify, unify, unify_inplace
+from unification.substitution import (
+    ArraySubstitution,
+    FrozenSubstitution,
+    LayeredSubstitution,
+    Substitution,
+    TrailSubstitution,
+    UnionFindSubstitution,
+)
+
+
+class Collider(object):
+    """An object with a constant hash value."""
+
+    def __init__(self, n):
+        self.n = n
+
+    def __hash__(self):
+        return 1
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.n == other.n
+
+    def __repr__(self):
+        return f"Collider({self.n})"
+
+
+def test_Substitution_mapping():
+    x, y = var(), var()
+    s = Substitution({x: 1})
+    assert len(s) == 1
+    assert s[x] == 1
+    assert x in s
+    assert y not in s
+    assert s.get(y) is None
+    assert s.get(y, 2) == 2
+    assert s == {x: 1}
+    assert list(s) == [x]
+
+    with pytest.raises(KeyError):
+        s[y]
+
+    assert Substitution() == {}
+    assert Substitution(a=1, b=2) == {"a": 1, "b": 2}
+    assert repr(Substitution({1: 2})) == "Substitution({1: 2})"
+
+
+def test_Substitution_persistence():
+    n = 300
+    vs = [var() for i in range(n)]
+
+    subs = [Substitution()]
+    for i, v in enumerate(vs):
+        subs.append(subs[-1].set(v, i))
+
+    for i, s in enumerate(subs):
+        assert len(s) == i
+        assert all(s[v] == j for j, v in enumerate(vs[:i]))
+        assert all(v not in s for v in vs[i:])
+
+    s = subs[-1]
+    assert s.set(vs[0], 0) is s
+    s2 = s.set(vs[0], -1)
+    assert len(s2) == n
+    assert s2[vs[0]] == -1
+    assert s[vs[0]] == 0
+
+    s3 = s
+    for v in vs:
+        s3 = s3.delete(v)
+    assert len(s3) == 0
+    assert s3 == {}
+    assert len(s) == n
+
+    with pytest.raises(KeyError):
+        s3.delete(vs[0])
+
+
+def test_Substitution_collisions():
+    keys = [Collider(i) for i in range(5)]
+
+    s = Substitution()
+    for i, k in enumerate(keys):
+        s = s.set(k, i)
+
+    assert len(s) == 5
+    assert dict(s) == {k: i for i, k in enumerate(keys)}
+    assert s.set(keys[0], 0) is s
+    assert s.set(keys[0], 10)[keys[0]] == 10
+
+    s2 = s.delete(keys[2])
+    assert keys[2] not in s2
+    assert len(s2) == 4
+
+    for k in keys:
+        s = s.delete(k)
+    assert len(s) == 0
+
+
+def test_Substitution_unify_reify():
+    x, y, z = var(), var(), var()
+    s = Substitution()
+
+    assert assoc(s, x, 1) == {x: 1}
+    assert len(s) == 0
+
+    res = unify((x, (y, 2)), (1, (z, z)), s)
+    assert isinstance(res, Substitution)
+    assert res == {x: 1, y: z, z: 2}
+    assert len(s) == 0
+
+    assert unify((x, 2), (1, 3), s) is False
+    assert reify((x, [y, {3: z}]), res) == (1, [2, {3: 2}])
+
+
+def test_TrailSubstitution():
+    x, y, z = var(), var(), var()
+    s = TrailSubstitution({x: 1})
+    mark = s.checkpoint()
+
+    s[y] = 2
+    s[x] = 3
+    del s[x]
+    s.update({z: 4})
+    assert s.setdefault(y, 5) == 2
+    assert s.pop(z) == 4
+    assert s.pop(z, None) is None
+    assert s == {y: 2}
+
+    s.rollback(mark)
+    assert s == {x: 1}
+    assert s.checkpoint() == mark
+
+    mark = s.checkpoint()
+    s |= {y: 2}
+    assert s.popitem() == (y, 2)
+    s.clear()
+    assert s == {}
+    s.rollback(mark)
+    assert s == {x: 1}
+
+    s2 = s.copy()
+    assert type(s2) is TrailSubstitution
+    s2[y] = 1
+    assert y not in s
+    assert repr(TrailSubstitution({1: 2})) == "TrailSubstitution({1: 2})"
+
+
+def test_TrailSubstitution_unify():
+    x, y = var(), var()
+    s = TrailSubstitution()
+
+    assert assoc(s, x, 1) is s
+    assert s == {x: 1}
+
+    mark = s.checkpoint()
+    assert unify((x, y), (1, 2), s) is s
+    assert s == {x: 1, y: 2}
+    s.rollback(mark)
+    assert s == {x: 1}
+    assert reify((x, y), s) == (1, y)
+
+
+def test_UnionFindSubstitution():
+    x, y, z = var(), var(), var()
+
+    s = UnionFindSubstitution({x: y, y: z, z: 1})
+    assert s[x] == 1
+    assert dict(s) == {x: 1, y: 1, z: 1}
+    assert s.get(y) == 1
+    assert s.get(2, 3) == 3
+
+    s = UnionFindSubstitution()
+    assert assoc(s, x, y) is s
+    assert s == {x: y}
+    # `y` now has a higher rank than `z`, so `z` is bound to `y`.
+    assert assoc(s, y, z) == {x: y, z: y}
+
+    s2 = s.copy()
+    assoc(s2, y, 1)
+    assert y not in s
+    assert reify((x, z), s2) == (1, 1)
+
+
+def test_UnionFindSubstitution_unify():
+    n = 100
+    vs = [var() for i in range(n)]
+
+    s = unify(vs[:-1], vs[1:], UnionFindSubstitution())
+    assert isinstance(s, UnionFindSubstitution)
+
+    s = unify(vs, [1] * n, s)
+    assert reify(vs, s) == [1] * n
+    assert unify(vs[0], 2, s) is False
+
+
+def test_ArraySubstitution():
+    x, y, z = IndexedVar(), IndexedVar(), var()
+    s = ArraySubstitution({x: 1, "a": 2})
+
+    assert len(s) == 2
+    assert s[x] == 1
+    assert s["a"] == 2
+    assert x in s
+    assert y not in s
+    assert IndexedVar() not in s
+    assert s.get(y) is None
+    assert s.get(x) == 1
+    assert s.get("b", 3) == 3
+    assert s == {x: 1, "a": 2}
+
+    with pytest.raises(KeyError):
+        s[y]
+
+    with pytest.raises(KeyError):
+        s[IndexedVar()]
+
+    with pytest.raises(KeyError):
+        del s[y]
+
+    mark = s.checkpoint()
+    s[y] = 3
+    s[z] = 4
+    s[x] = 5
+    del s["a"]
+    assert s == {x: 5, y: 3, z: 4}
+    assert len(s) == 3
+
+    s.rollback(mark)
+    assert s == {x: 1, "a": 2}
+    assert len(s) == 2
+
+    s2 = s.copy()
+    s2[y] = 1
+    assert y not in s
+    assert repr(ArraySubstitution({"a": 1})) == "ArraySubstitution({'a': 1})"
+
+
+def test_ArraySubstitution_sparse():
+    lvars = [IndexedVar() for _ in range(1000)]
+    x, y = lvars[500], lvars[501]
+
+    # Only the range of the bound indices is stored.
+    s = ArraySubstitution({y: 1})
+    s[x] = 2
+    assert len(s._values) <= 2
+    assert s == {x: 2, y: 1}
+
+    s = ArraySubstitution()
+    for i, lv in enumerate(reversed(lvars)):
+        s[lv] = i
+    assert len(s._values) < 2 * len(lvars)
+    assert all(s[lv] == i for i, lv in enumerate(reversed(lvars)))
+
+    s2 = s.copy()
+    del s2[lvars[0]]
+    assert lvars[0] in s and lvars[0] not in s2
+    assert len(s2) == len(lvars) - 1
+
+
+def test_ArraySubstitution_unify():
+    x, y, z = IndexedVar(), IndexedVar(), IndexedVar()
+    s = ArraySubstitution()
+
+    assert assoc(s, x, 1) is s
+    assert unify((x, [y, z]), (1, [z, 2]), s) is s
+    assert s == {x: 1, y: z, z: 2}
+    assert reify((x, y, z), s) == (1, 2, 2)
+
+    s = ArraySubstitution()
+    assert unify_inplace((x, y, 3), (1, 2, 4), s) is False
+    assert len(s) == 0
+
+
+def test_LayeredSubstitution():
+    x, y, z = var(), var(), var()
+    base = {x: 1, y: 2}
+
+    s = LayeredSubstitution(base)
+    assert s.depth == 1
+    assert s == base
+    assert len(s) == 2
+
+    s2 = s.set(y, 3).set(z, 4)
+    assert s2.parent is base
+    assert s2.bindings == {y: 3, z: 4}
+    assert s2 == {x: 1, y: 3, z: 4}
+    assert len(s2) == 3
+    assert sorted(map(str, s2)) == sorted(map(str, [x, y, z]))
+    assert s2.get(y) == 3
+    assert s2.get("a", 5) == 5
+    assert s == base
+    assert base == {x: 1, y: 2}
+
+    with pytest.raises(KeyError):
+        s2["a"]
+
+    assert LayeredSubstitution() == {}
+    assert LayeredSubstitution(bindings={x: 1}) == {x: 1}
+    assert assoc(s, z, 1) == {x: 1, y: 2, z: 1}
+    assert (
+        repr(LayeredSubstitution({1: 2}, {3: 4}))
+        == "LayeredSubstitution({1: 2}, {3: 4})"
+    )
+
+
+def test_LayeredSubstitution_flatten():
+    base = {"a": 0}
+    s = base
+    for i in range(LayeredSubstitution.max_depth * 2):
+        s = LayeredSubstitution(s, {i: i, "a": i})
+        assert s.depth <= LayeredSubstitution.max_depth
+        assert s.bindings == {i: i, "a": i}
+
+    n = LayeredSubstitution.max_depth * 2
+    assert s == dict({i: i for i in range(n)}, a=n - 1)
+
+    s = s.flatten()
+    assert s.depth == 1
+    assert s.parent is base
+    assert len(s) == n + 1
+
+
+def test_unify_delta():
+    x, y, z = var(), var(), var()
+    base = {x: 1}
+
+    assert unify((x, y), (1, 2), base, delta=True) == {y: 2}
+    assert unify((x, y), (2, 2), base, delta=True) is False
+    assert unify(x, x, base, delta=True) == {}
+    assert unify(y, z, delta=True) == {y: z}
+    assert base == {x: 1}
+
+    s = LayeredSubstitution(base, {y: 2})
+    assert unify((x, y, z), (1, 2, 3), s, delta=True) == {z: 3}
+    assert s == {x: 1, y: 2}
+
+
+def test_FrozenSubstitution():
+    x, y, z = var(), var(), var()
+
+    s = FrozenSubstitution({x: 1, y: (2, z)})
+    assert hash(s) == hash(FrozenSubstitution().set(y, (2, z)).set(x, 1))
+    assert s == {x: 1, y: (2, z)}
+    assert s.copy() is s
+
+    s2 = s.set(z, 3)
+    assert isinstance(s2, FrozenSubstitution)
+    assert hash(s2) == hash(FrozenSubstitution({x: 1, y: (2, z), z: 3}))
+    assert hash(s2.set(x, 4)) == hash(FrozenSubstitution({x: 4, y: (2, z), z: 3}))
+    assert hash(s2.delete(z)) == hash(s)
+    assert s2.set(z, 3) is s2
+    assert hash(FrozenSubstitution()) == hash(FrozenSubstitution({x: 1}).delete(x))
+
+    cache = {(x, s): "a"}
+    assert cache[(x, FrozenSubstitution({y: (2, z), x: 1}))] == "a"
+
+    s3 = s.set(z, [1])
+    assert s3[z] == [1]
+    with pytest.raises(TypeError):
+        hash(s3)
+    with pytest.raises(TypeError):
+        hash(s3.set(x, 2))
+    with pytest.raises(TypeError):
+        hash(FrozenSubstitution({z: [1]}))
+
+    # The hash is restored once the unhashable bindings are removed.
+    assert hash(s3.delete(z)) == hash(s)
+    assert hash(s3.set(z, 3)) == hash(s.set(z, 3))
+    assert hash(FrozenSubstitution({z: [1]}).delete(z)) == hash(FrozenSubstitution())
+
+
+def test_FrozenSubstitution_unify():
+    x, y = var(), var()
+    s = FrozenSubstitution({x: 1})
+
+    res = unify((x, y), (1, 2), s)
+    assert isinstance(res, FrozenSubstitution)
+    assert res == {x: 1, y: 2}
+    assert hash(res) == hash(FrozenSubstitution({x: 1, y: 2}))
+    assert reify((x, y), res) == (1, 2)
+    assert unify(x, 2, s) is False
+
+
+_pickle_script = """
+import pickle
+import sys
+
+from unification import IndexedVar, var
+from unification.codec import dumps
+from unification.substitution import (
+    ArraySubstitution,
+    FrozenSubstitution,
+    LayeredSubstitution,
+    Substitution,
+    TrailSubstitution,
+    UnionFindSubstitution,
+)
+
+# Advance the index counter, so the indices differ from the parent's.
+[IndexedVar() for _ in range(100)]
+
+x, i = var("x"), IndexedVar("i")
+bindings = {x: 1, i: (2, x), "a": 3}
+subs = [
+    Substitution(bindings),
+    FrozenSubstitution(bindings),
+    TrailSubstitution(bindings),
+    UnionFindSubstitution(bindings),
+    ArraySubstitution(bindings),
+    LayeredSubstitution(Substitution({x: 1}), {i: (2, x), "a": 3}),
+]
+sys.stdout.buffer.write(pickle.dumps((subs, [dumps(s) for s in subs])))
+"""
+
+
+@pytest.mark.parametrize("hash_seed", ["1", "2"])
+def test_substitution_pickle_subprocess(hash_seed):
+    res = subprocess.run(
+        [sys.executable, "-c", _pickle_script],
+        env=dict(os.environ, PYTHONHASHSEED=hash_seed),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    subs, encoded = pickle.loads(res.stdout)
+
+    x, i = var("x"), IndexedVar("i")
+    expected = {x: 1, i: (2, x), "a": 3}
+
+    for s in subs + [loads(b) for b in encoded]:
+        assert s[x] == 1
+        assert s[i] == (2, x)
+        assert dict(s.items()) == expected
+        assert len(s) == 3
+
+    frozen = subs[1]
+    assert hash(frozen) == hash(FrozenSubstitution(expected))
+
+    trail = subs[2]
+    mark = trail.checkpoint()
+    trail[var("y")] = 4
+    trail.rollback(mark)
+    assert trail == expected
@@ -1,4 +1,38 @@
-from unification.variable import Var, isvar, var, variables, vars
+import asyncio
+import operator
+import pickle
+import threading
+from copy import copy, deepcopy
+
+import pytest
+
+from unification.core import reify, unify
+from unification.variable import (
+    AnonVar,
+    IndexedVar,
+    Var,
+    _restore_var,
+    _var_types,
+    disable_strict_mode,
+    enable_strict_mode,
+    fresh,
+    isvar,
+    isvar_strict,
+    var,
+    variables,
+    vars,
+)
+
+
+@pytest.fixture
+def var_registry():
+    """Undo the registration of virtual `Var` subclasses within a test."""
+    var_types = dict(_var_types)
+    yield
+    Var._abc_registry_clear()
+    Var._abc_caches_clear()
+    _var_types.clear()
+    _var_types.update(var_types)
 
 
 def test_isvar():
@@ -24,13 +58,224 @@ def test_var_inputs():
     assert var() != var()
 
 
+def test_var_subclass():
+    class CustomVar(Var):
+        pass
+
+    assert CustomVar() != CustomVar()
+
+
+def test_IndexedVar():
+    a, b = IndexedVar(), IndexedVar()
+    assert isvar(a)
+    assert a != b
+    assert b.index == a.index + 1
+    assert IndexedVar("ia") is IndexedVar("ia")
+    assert IndexedVar("ia").index == IndexedVar("ia").index
+    assert IndexedVar("ia") != var("ia")
+    assert var() != var()
+
+
 def test_vars():
     vs = vars(3)
     assert len(vs) == 3
     assert all(map(isvar, vs))
 
 
+def test_vars_threads():
+    n_threads, n = 8, 2000
+    barrier = threading.Barrier(n_threads)
+    results = []
+
+    def run():
+        barrier.wait()
+        lvars = [var() for _ in range(n)]
+        ivars = [IndexedVar() for _ in range(n)]
+        named = [var(f"shared_{i}") for i in range(n)]
+        results.append((lvars, ivars, named))
+
+    threads = [threading.Thread(target=run) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    tokens = {v.token for lvars, ivars, _ in results for v in lvars + ivars}
+    assert len(tokens) == 2 * n * n_threads
+
+    indices = {v.index for _, ivars, _ in results for v in ivars}
+    assert len(indices) == n * n_threads
+
+    named = results[0][2]
+    assert all(all(map(operator.is_, named, r[2])) for r in results)
+
+
+def test_restore_var_id_block():
+    x = var()
+    n = int(x.token[1:])
+
+    # The restored token is in this thread's current block of ids, so the
+    # remainder of the block can't be used anymore.
+    restored = _restore_var(Var, f"_{n + 1}")
+    assert all(var() is not restored for _ in range(10))
+
+    # Copying an interned variable doesn't discard any blocks.
+    y = var()
+    assert all(deepcopy(y) is y for _ in range(100))
+    assert pickle.loads(pickle.dumps(y)) is y
+    assert int(var().token[1:]) == int(y.token[1:]) + 1
+
+
 def test_context_manager():
     with variables(1):
         assert isvar(1)
     assert not isvar(1)
+
+
+def test_context_manager_nested():
+    with variables(1):
+        with variables(2):
+            assert isvar(1) and isvar(2)
+        assert isvar(1) and not isvar(2)
+    assert not isvar(1) and not isvar(2)
+
+
+def test_context_manager_threads():
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def run(obj, other):
+        with variables(obj):
+            barrier.wait()
+            results[obj] = (isvar(obj), isvar(other))
+            barrier.wait()
+        results[obj] += (isvar(obj),)
+
+    threads = [
+        threading.Thread(target=run, args=(1, 2)),
+        threading.Thread(target=run, args=(2, 1)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {1: (True, False, False), 2: (True, False, False)}
+    assert not isvar(1) and not isvar(2)
+
+
+def test_context_manager_tasks():
+    async def run(obj, other):
+        with variables(obj):
+            await asyncio.sleep(0)
+            res = (isvar(obj), isvar(other))
+            await asyncio.sleep(0)
+        return res + (isvar(obj),)
+
+    async def main():
+        return await asyncio.gather(run("x", "y"), run("y", "x"))
+
+    assert asyncio.run(main()) == [(True, False, False), (True, False, False)]
+
+
+def test_isvar_types(var_registry):
+    class CustomVar(Var):
+        pass
+
+    class VirtualVar(object):
+        pass
+
+    Var.register(VirtualVar)
+
+    assert isvar(Var)
+    assert isvar(CustomVar)
+    assert isvar(VirtualVar())
+    assert isinstance(CustomVar(), Var)
+    assert not isvar([1])
+    assert not isinstance([1], Var)
+
+
+def test_isvar_virtual_subclasses(var_registry):
+    class VirtualVar(object):
+        pass
+
+    class SubVar(VirtualVar):
+        pass
+
+    assert not isvar(SubVar())
+
+    Var.register(VirtualVar)
+
+    class SubSubVar(SubVar):
+        pass
+
+    assert isvar(SubVar())
+    assert isvar_strict(SubVar())
+    assert isvar(SubSubVar())
+    assert isinstance(SubSubVar(), Var)
+    assert not isvar(object())
+
+
+def test_context_manager_unhashable():
+    with variables(1):
+        assert isvar(1)
+        assert not isvar([1])
+        assert not isvar((1,))
+    assert not isvar(1)
+
+
+def test_strict_mode():
+    try:
+        enable_strict_mode()
+        assert isvar(var())
+        assert not isvar(1)
+
+        with pytest.raises(RuntimeError):
+            with variables(1):
+                pass
+    finally:
+        disable_strict_mode()
+
+    with variables(1):
+        assert isvar(1)
+        assert not isvar_strict(1)
+        assert isvar_strict(var())
+        with pytest.raises(RuntimeError):
+            enable_strict_mode()
+
+
+def test_fresh():
+    x, y = fresh(), fresh()
+
+    assert isvar(x)
+    assert isinstance(x, AnonVar)
+    assert x == x
+    assert x != y
+    assert x != var(x.token)
+    assert var(x.token) != x
+    assert len({x, y, x}) == 2
+    assert str(x) == f"~{x.token}"
+    assert x.token == x.token
+    assert x.token != y.token
+
+    assert copy(x) is x
+    assert deepcopy((x, [x])) == (x, [x])
+
+    a, b = pickle.loads(pickle.dumps((x, x)))
+    assert a is b
+    assert a is not x
+    assert isinstance(a, AnonVar)
+
+    with pytest.raises(TypeError):
+        fresh("x")
+
+
+def test_fresh_unify():
+    x, y = fresh(), fresh()
+
+    s = unify((x, [y, 2]), (1, [x, y]), {})
+    assert s is False
+
+    s = unify((x, [y, 2]), (1, [x, 2]), {})
+    assert s == {x: 1, y: 1}
+    assert reify((y, x), s) == (1, 1)
@@ -1,4 +1,5 @@
 import sys
+from contextlib import contextmanager
 
 from unification.variable import var
 
@@ -34,3 +35,22 @@ def gen_long_chain(last_elem=None, N=None, use_lvars=False):
             lvars[i_el] = i
         b_struct = [i_el, last_elem if i == N - 1 else b_struct]
     return b_struct, lvars
+
+
+@contextmanager
+def registered(dispatcher, signature, func):
+    """Register `func` for `signature` with `dispatcher` only within the context.
+
+    Any implementation that was previously registered for `signature` is
+    restored afterward.
+    """
+    signature = tuple(signature)
+    prev = dispatcher.funcs.get(signature)
+    dispatcher.add(signature, func)
+    try:
+        yield
+    finally:
+        del dispatcher.funcs[signature]
+        if prev is not None:
+            dispatcher.add(signature, prev)
+        dispatcher._cache.clear()
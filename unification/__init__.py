@@ -1,7 +1,23 @@
 from ._version import get_versions
-from .core import assoc, reify, unify
+from .core import (
+    StepLimitExceeded,
+    assoc,
+    normalize,
+    reify,
+    rename_apart,
+    unify,
+    unify_inplace,
+)
 from .more import unifiable
-from .variable import Var, isvar, var, variables, vars
+from .substitution import (
+    ArraySubstitution,
+    FrozenSubstitution,
+    LayeredSubstitution,
+    Substitution,
+    TrailSubstitution,
+    UnionFindSubstitution,
+)
+from .variable import AnonVar, IndexedVar, Var, fresh, isvar, var, variables, vars
 
 __version__ = get_versions()["version"]
 del get_versions
@@ -0,0 +1,53 @@
+"""Cooperative `asyncio` versions of `unify` and `reify`.
+
+These coroutines evaluate terms in chunks of steps (see `unify`'s
+`max_steps`), and yield to the event loop between the chunks, so that large
+terms don't block other tasks.
+
+>>> x = var('x')
+>>> asyncio.run(aunify((1, x), (1, 2), {}))
+{~x: 2}
+"""
+
+import asyncio
+
+from .core import StepLimitExceeded, reify, unify
+
+# The default number of steps between yields to the event loop.
+default_yield_every = 1000
+
+
+async def _run_in_steps(func, args, kwargs, yield_every):
+    if "max_steps" in kwargs:
+        raise TypeError(
+            f"a{func.__name__}() doesn't accept `max_steps`; use `yield_every` to "
+            "set the number of steps between yields"
+        )
+
+    if yield_every is None:
+        yield_every = default_yield_every
+    elif yield_every < 1:
+        raise ValueError(f"`yield_every` must be at least 1, not {yield_every}")
+
+    try:
+        return func(*args, max_steps=yield_every, **kwargs)
+    except StepLimitExceeded as e:
+        cont = e.continuation
+
+    while True:
+        await asyncio.sleep(0)
+
+        try:
+            return cont.resume(yield_every)
+        except StepLimitExceeded:
+            pass
+
+
+async def aunify(u, v, *args, yield_every=None, **kwargs):
+    """Unify `u` and `v` like `unify`, yielding every `yield_every` steps."""
+    return await _run_in_steps(unify, (u, v) + args, kwargs, yield_every)
+
+
+async def areify(e, s, yield_every=None, **kwargs):
+    """Reify `e` like `reify`, yielding every `yield_every` steps."""
+    return await _run_in_steps(reify, (e, s), kwargs, yield_every)
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+
+_term_cache = None
+
+
+class IdentityCache(object):
+    """A bounded, least-recently-used cache keyed by object identity.
+
+    Entries hold a reference to their key objects, so an object's `id` can't be
+    reused by another object while it's cached.  This makes the cache usable
+    with unhashable and non-weak-referenceable objects (e.g. `tuple`s that
+    contain `list`s).
+
+    >>> cache = IdentityCache(maxsize=2)
+    >>> a, b, c = (1,), (2,), (3,)
+    >>> cache.set(a, "a"); cache.set(b, "b"); cache.set(c, "c")
+    >>> cache.get(a) is None, cache.get(c)
+    (True, 'c')
+    """
+
+    __slots__ = ("maxsize", "_entries")
+
+    def __init__(self, maxsize=2**16):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, obj, default=None):
+        entry = self._entries.get(id(obj))
+
+        if entry is None or entry[0] is not obj:
+            return default
+
+        self._entries.move_to_end(id(obj))
+
+        return entry[1]
+
+    def set(self, obj, value):
+        entries = self._entries
+        entries[id(obj)] = (obj, value)
+        entries.move_to_end(id(obj))
+
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def enable_term_cache(maxsize=2**16):
+    """Enable caching of term metadata (e.g. groundness) and return the cache.
+
+    When enabled, `unify`, `reify`, `isground` and `unground_lvars` look up
+    whether an immutable container term (i.e. a `tuple`, `frozenset` or
+    `slice`) contains any logic variables, and skip the ground ones without
+    traversing them.  Only containers made of built-in immutable atoms (e.g.
+    `int`s and `str`s) and other such containers are considered ground, since
+    any other object could be mutable or have its own `_unify` or `_reify`
+    implementation.  The cache isn't updated when implementations are
+    registered for those built-in types, though, so the cache should be
+    disabled (or re-enabled) after doing that.
+    """
+    global _term_cache
+    _term_cache = IdentityCache(maxsize)
+    return _term_cache
+
+
+def disable_term_cache():
+    """Disable--and discard--the term metadata cache."""
+    global _term_cache
+    _term_cache = None
+
+
+def get_term_cache():
+    """Return the term metadata cache, or ``None`` when it isn't enabled."""
+    return _term_cache
@@ -0,0 +1,280 @@
+r"""A compact binary encoding for terms and substitutions.
+
+The encoding is a post-order stream of opcodes for a simple stack machine:
+the elements of a container are written first, followed by the container's
+opcode and element count.  Every string, bytes object, container and logic
+variable that's written is assigned a sequential index, and later occurrences
+of the same object are written as a back-reference to that index.  As a
+result, shared subterms (and repeated variables) are only encoded once, and
+they're shared again after decoding.
+
+Both the encoder and decoder use explicit stacks, so terms that are nested
+deeper than the recursion limit can be encoded.  Objects without a dedicated
+opcode are encoded with `pickle`.
+
+>>> x = var('x')
+>>> t = (1, [x, "a"], {x: x})
+>>> loads(dumps(t)) == t
+True
+"""
+
+import pickle
+from collections import OrderedDict
+from struct import Struct
+
+from .substitution import FrozenSubstitution, NormalizedSubstitution, Substitution
+from .variable import AnonVar, IndexedVar, Var, _restore_var
+
+MAGIC = b"U\x01"
+
+_float = Struct("<d")
+_complex = Struct("<dd")
+
+# Atoms
+NONE = 0x00
+TRUE = 0x01
+FALSE = 0x02
+INT = 0x03
+FLOAT = 0x04
+COMPLEX = 0x05
+# Memoized values
+STR = 0x10
+BYTES = 0x11
+TUPLE = 0x12
+LIST = 0x13
+SET = 0x14
+FROZENSET = 0x15
+SLICE = 0x16
+VAR = 0x17
+INDEXED_VAR = 0x18
+PICKLE = 0x19
+ANON_VAR = 0x1A
+# Mappings (also memoized)
+DICT = 0x20
+ORDERED_DICT = 0x21
+SUBSTITUTION = 0x22
+NORMALIZED_SUBSTITUTION = 0x23
+FROZEN_SUBSTITUTION = 0x24
+# Back-references
+REF = 0x30
+
+_seq_ops = {
+    tuple: TUPLE,
+    list: LIST,
+    set: SET,
+    frozenset: FROZENSET,
+}
+
+_mapping_ops = {
+    dict: DICT,
+    OrderedDict: ORDERED_DICT,
+    Substitution: SUBSTITUTION,
+    NormalizedSubstitution: NORMALIZED_SUBSTITUTION,
+    FrozenSubstitution: FROZEN_SUBSTITUTION,
+}
+
+_seq_ctors = {op: ctor for ctor, op in _seq_ops.items()}
+_mapping_ctors = {op: ctor for ctor, op in _mapping_ops.items()}
+
+
+def _write_uint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_uint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def dumps(obj):
+    """Encode a term or substitution as `bytes`."""
+    out = bytearray(MAGIC)
+    memo = {}
+    # Keep every memoized object alive, so that their `id`s stay unique.
+    keep = []
+    in_progress = set()
+    stack = [(obj, False)]
+
+    def memoize(o):
+        memo[id(o)] = len(keep)
+        keep.append(o)
+
+    while stack:
+        o, expanded = stack.pop()
+        t = type(o)
+
+        if expanded:
+            in_progress.discard(id(o))
+
+            if t is slice:
+                out.append(SLICE)
+            elif t in _mapping_ops:
+                out.append(_mapping_ops[t])
+                _write_uint(out, len(o))
+            elif t is Var:
+                out.append(VAR)
+            elif t is IndexedVar:
+                out.append(INDEXED_VAR)
+            else:
+                out.append(_seq_ops[t])
+                _write_uint(out, len(o))
+
+            memoize(o)
+            continue
+
+        if o is None:
+            out.append(NONE)
+        elif o is True:
+            out.append(TRUE)
+        elif o is False:
+            out.append(FALSE)
+        elif t is int:
+            out.append(INT)
+            _write_uint(out, 2 * o if o >= 0 else -2 * o - 1)
+        elif t is float:
+            out.append(FLOAT)
+            out += _float.pack(o)
+        elif t is complex:
+            out.append(COMPLEX)
+            out += _complex.pack(o.real, o.imag)
+        elif id(o) in memo:
+            out.append(REF)
+            _write_uint(out, memo[id(o)])
+        elif t is str or t is bytes:
+            b = o.encode("utf-8", "surrogatepass") if t is str else o
+            out.append(STR if t is str else BYTES)
+            _write_uint(out, len(b))
+            out += b
+            memoize(o)
+        elif t in _seq_ops or t in _mapping_ops or t is slice:
+            if id(o) in in_progress:
+                raise ValueError(f"Cannot encode cyclic object {o!r}")
+
+            in_progress.add(id(o))
+            stack.append((o, True))
+
+            if t is slice:
+                children = (o.start, o.stop, o.step)
+            elif t in _mapping_ops:
+                children = [e for item in o.items() for e in item]
+            else:
+                children = list(o)
+
+            stack.extend((c, False) for c in reversed(children))
+        elif t is Var or t is IndexedVar:
+            stack.append((o, True))
+            stack.append((o.token, False))
+        elif t is AnonVar:
+            # Anonymous variables are decoded as new ones; only their
+            # occurrences within the encoded object are preserved.
+            out.append(ANON_VAR)
+            memoize(o)
+        else:
+            b = pickle.dumps(o, protocol=pickle.HIGHEST_PROTOCOL)
+            out.append(PICKLE)
+            _write_uint(out, len(b))
+            out += b
+            memoize(o)
+
+    return bytes(out)
+
+
+def loads(data):
+    """Decode a term or substitution encoded by `dumps`.
+
+    Objects without a dedicated opcode are decoded with `pickle.loads`, which
+    can execute arbitrary code, so only decode data from trusted sources.
+    """
+    data = memoryview(data)
+
+    if bytes(data[: len(MAGIC)]) != MAGIC:
+        raise ValueError("Data wasn't encoded by `unification.codec.dumps`")
+
+    pos = len(MAGIC)
+    end = len(data)
+    stack = []
+    memo = []
+
+    while pos < end:
+        op = data[pos]
+        pos += 1
+
+        if op == NONE:
+            stack.append(None)
+            continue
+        elif op == TRUE:
+            stack.append(True)
+            continue
+        elif op == FALSE:
+            stack.append(False)
+            continue
+        elif op == INT:
+            n, pos = _read_uint(data, pos)
+            stack.append(n >> 1 if not n & 1 else -((n + 1) >> 1))
+            continue
+        elif op == FLOAT:
+            stack.append(_float.unpack_from(data, pos)[0])
+            pos += _float.size
+            continue
+        elif op == COMPLEX:
+            stack.append(complex(*_complex.unpack_from(data, pos)))
+            pos += _complex.size
+            continue
+        elif op == REF:
+            i, pos = _read_uint(data, pos)
+            stack.append(memo[i])
+            continue
+
+        if op == STR or op == BYTES or op == PICKLE:
+            n, pos = _read_uint(data, pos)
+            b = data[pos : pos + n]
+            pos += n
+            if op == STR:
+                res = str(b, "utf-8", "surrogatepass")
+            elif op == BYTES:
+                res = bytes(b)
+            else:
+                res = pickle.loads(b)
+        elif op == SLICE:
+            res = slice(*stack[-3:])
+            del stack[-3:]
+        elif op == VAR or op == INDEXED_VAR:
+            res = _restore_var(Var if op == VAR else IndexedVar, stack.pop())
+        elif op == ANON_VAR:
+            res = AnonVar()
+        elif op in _seq_ctors or op in _mapping_ctors:
+            n, pos = _read_uint(data, pos)
+
+            if op in _mapping_ctors:
+                n *= 2
+
+            if n:
+                items = stack[-n:]
+                del stack[-n:]
+            else:
+                items = []
+
+            if op in _mapping_ctors:
+                res = _mapping_ctors[op](zip(items[::2], items[1::2]))
+            else:
+                res = _seq_ctors[op](items)
+        else:
+            raise ValueError(f"Unknown opcode {op:#x} at position {pos - 1}")
+
+        memo.append(res)
+        stack.append(res)
+
+    if len(stack) != 1:
+        raise ValueError("Malformed data")
+
+    return stack[0]
@@ -2,11 +2,25 @@ from collections import OrderedDict, deque
 from collections.abc import Generator, Iterator, Mapping, Set
 from copy import copy
 from functools import partial
-from operator import length_hint
+from itertools import islice
+from operator import is_, length_hint
 
+from . import cache as _cache_module
+from . import variable as _variable_module
+from .cache import IdentityCache
 from .dispatch import dispatch
+from .hashcons import HashConsedTuple, _ground_types, _hashcons_elements
+from .substitution import (
+    ArraySubstitution,
+    LayeredSubstitution,
+    NormalizedSubstitution,
+    Substitution,
+    TrailSubstitution,
+    UnionFindSubstitution,
+    _missing,
+)
 from .utils import transitive_get as walk
-from .variable import Var, isvar
+from .variable import Var, fresh, isvar
 
 # An object used to tell the reifier that the next yield constructs the reified
 # object from its constituent refications (if any).
@@ -24,6 +38,26 @@ def assoc(s, u, v):
     return s
 
 
+@assoc.register((Substitution, LayeredSubstitution), object, object)
+def assoc_Substitution(s, u, v):
+    return s.set(u, v)
+
+
+@assoc.register((TrailSubstitution, ArraySubstitution), object, object)
+def assoc_inplace(s, u, v):
+    s[u] = v
+    return s
+
+
+@assoc.register(UnionFindSubstitution, object, object)
+def assoc_UnionFindSubstitution(s, u, v):
+    if u in s:
+        s[u] = v
+    else:
+        s.union(u, v)
+    return s
+
+
 def stream_eval(z, res_filter=None):
     r"""Evaluate a stream of `_reify`/`_unify` results.
 
@@ -59,6 +93,98 @@ def stream_eval(z, res_filter=None):
     return z_out
 
 
+def _stream_eval_steps(z, steps):
+    """Evaluate a stream of `_reify`/`_unify` results like `stream_eval`.
+
+    This is a generator that suspends (i.e. yields) whenever its budget of
+    `steps` runs out, and expects to be sent a new budget (``None`` for no
+    limit) when it's resumed.  It returns the result and the remaining steps.
+    """
+    if not isinstance(z, Generator):
+        return z, steps
+
+    stack = [z]
+    z_args, z_out = None, None
+
+    while stack:
+        if steps == 0:
+            max_steps = yield
+            steps = -1 if max_steps is None else max_steps
+
+        steps -= 1
+        z = stack[-1]
+
+        try:
+            z_out = z.send(z_args)
+
+            if isinstance(z_out, Generator):
+                stack.append(z_out)
+                z_args = None
+            else:
+                z_args = z_out
+
+        except StopIteration:
+            stack.pop()
+
+    return z_out, steps
+
+
+class StepLimitExceeded(Exception):
+    """An exception raised when `unify` or `reify` runs out of steps.
+
+    The suspended computation can be resumed with the ``continuation``
+    attribute.
+
+    >>> x = var('x')
+    >>> try:
+    ...     unify([x, 2, 3], [1, 2, 3], {}, max_steps=2)
+    ... except StepLimitExceeded as e:
+    ...     print(e.continuation.resume())
+    {~x: 1}
+    """
+
+    def __init__(self, continuation):
+        super().__init__("The step limit was exceeded")
+        self.continuation = continuation
+
+
+def _check_max_steps(max_steps):
+    if max_steps is not None and max_steps < 1:
+        raise ValueError(f"`max_steps` must be at least 1, not {max_steps}")
+
+
+class Continuation(object):
+    """A suspended `unify` or `reify` computation."""
+
+    __slots__ = ("_engine", "_finish")
+
+    def __init__(self, engine, finish=None):
+        self._engine = engine
+        self._finish = finish
+        # Run the engine up to the point at which it expects a budget.
+        next(engine)
+
+    def _then(self, func):
+        """Apply `func` to the result of the computation when it's finished."""
+        finish = self._finish
+        self._finish = func if finish is None else lambda res: func(finish(res))
+
+    def resume(self, max_steps=None):
+        """Continue the computation for at most `max_steps` steps.
+
+        The result is returned when the computation finishes; otherwise,
+        `StepLimitExceeded` is raised (again) with this continuation.
+        """
+        _check_max_steps(max_steps)
+
+        try:
+            self._engine.send(max_steps)
+        except StopIteration as e:
+            return e.value if self._finish is None else self._finish(e.value)
+
+        raise StepLimitExceeded(self)
+
+
 class UngroundLVarException(Exception):
     """An exception signaling that an unground variable was found."""
 
@@ -78,6 +204,11 @@ def _reify_Var(o, s):
         yield _reify(o_w, s)
 
 
+@_reify.register(Var, NormalizedSubstitution)
+def _reify_Var_normalized(o, s):
+    yield s.get(o, o)
+
+
 def _reify_Iterable_ctor(ctor, t, s):
     """Create a generator that yields `_reify` generators.
 
@@ -87,21 +218,28 @@ def _reify_Iterable_ctor(ctor, t, s):
 
     This approach allows us "collapse" nested `_reify` calls by pushing nested
     calls up the stack.
+
+    When none of the elements change, `t` itself is returned (unless it's an
+    iterator, which has been consumed).
     """
     res = []
+    changed = ctor is iter
 
-    if isinstance(t, Mapping):
-        t = t.items()
-
-    for y in t:
+    for y in t.items() if isinstance(t, Mapping) else t:
         r = _reify(y, s)
         if isinstance(r, Generator):
             r = yield r
+        changed = changed or r is not y
         res.append(r)
 
     yield construction_sentinel
 
-    yield ctor(res)
+    yield ctor(res) if changed else t
+
+
+# The constructors used by each of the `_reify_Iterable_ctor` implementations,
+# and whether or not they construct a mapping.
+_reify_ctors = {}
 
 
 for seq, ctor in (
@@ -110,12 +248,17 @@ for seq, ctor in (
     (Iterator, iter),
     (set, set),
     (frozenset, frozenset),
+    (HashConsedTuple, _hashcons_elements),
 ):
-    _reify.add((seq, Mapping), partial(_reify_Iterable_ctor, ctor))
+    func = partial(_reify_Iterable_ctor, ctor)
+    _reify_ctors[func] = (ctor, False)
+    _reify.add((seq, Mapping), func)
 
 
 for seq in (dict, OrderedDict):
-    _reify.add((seq, Mapping), partial(_reify_Iterable_ctor, seq))
+    func = partial(_reify_Iterable_ctor, seq)
+    _reify_ctors[func] = (seq, True)
+    _reify.add((seq, Mapping), func)
 
 
 @_reify.register(slice, Mapping)
@@ -126,11 +269,326 @@ def _reify_slice(o, s):
 
     yield construction_sentinel
 
-    yield slice(start, stop, step)
+    if start is o.start and stop is o.stop and step is o.step:
+        yield o
+    else:
+        yield slice(start, stop, step)
+
+
+_reify_object = _reify.dispatch(object, Mapping)
+
+
+# An object used to mark the end of a container's elements in `_term_ground`.
+_ground_marker = object()
+
+# The constructors of the containers whose elements can't be changed.
+_immutable_ctors = (tuple, frozenset, _hashcons_elements)
+
+_no_lvars = frozenset()
+
+
+def _is_immutable_container(t, func):
+    """Determine whether `t` is a container whose elements can't be changed."""
+    return func is _reify_slice or (
+        func in _reify_ctors and _reify_ctors[func][0] in _immutable_ctors
+    )
+
+
+def _term_children(t, func):
+    """Return the elements of the container `t` and whether `t` is immutable.
+
+    `func` is the `_reify` implementation for `t`.  The elements of a mapping
+    are its keys and values, alternately.  Iterators have no elements here,
+    since traversing them would consume them.  ``None`` is returned when `t`
+    isn't one of the containers handled by the `_reify` implementations in
+    this module.
+    """
+    if func is _reify_slice:
+        return (t.start, t.stop, t.step), True
+
+    ctor_info = _reify_ctors.get(func)
+
+    if ctor_info is None:
+        return None
+
+    ctor, mapping = ctor_info
+
+    if ctor is iter:
+        return (), False
+    elif mapping:
+        return [c for item in t.items() for c in item], False
+    else:
+        return t, ctor in _immutable_ctors
+
+
+def _term_ground(t, tcache):
+    """Determine whether the immutable container `t` contains no logic variables.
+
+    The results for `t` and every immutable container within it are stored in
+    `tcache`.  Only atoms of the built-in types in `_ground_types` and other
+    immutable containers can be elements of a ground container; any other
+    object could have its own `_unify` or `_reify` implementation.
+    """
+    res = tcache.get(t)
+
+    if res is not None:
+        return res[0]
+
+    cache = _reify._cache
+    todo = [t]
+    flags = []
+
+    while todo:
+        x = todo.pop()
+
+        if x is _ground_marker:
+            n = todo.pop()
+            x = todo.pop()
+            ground = all(flags[-n:]) if n else True
+            if n:
+                del flags[-n:]
+            tcache.set(x, (ground,))
+            flags.append(ground)
+            continue
+
+        if type(x) in _ground_types:
+            flags.append(True)
+            continue
+        elif isvar(x):
+            flags.append(False)
+            continue
+        elif type(x) is HashConsedTuple and x.ground:
+            flags.append(True)
+            continue
+
+        types = (type(x), dict)
+        func = cache.get(types) or _reify.dispatch(*types)
+        children = _term_children(x, func)
+
+        if children is not None and children[1]:
+            res = tcache.get(x)
+
+            if res is not None:
+                flags.append(res[0])
+                continue
+
+            children = children[0]
+            todo.append(x)
+            todo.append(len(children))
+            todo.append(_ground_marker)
+            todo.extend(children)
+        else:
+            flags.append(False)
+
+    return flags[0]
+
+
+def _term_lvars(t, tcache):
+    """Return the logic variables that occur in the immutable container `t`.
+
+    The variables are found structurally (i.e. without a substitution), and
+    only the result for `t` itself is added to `tcache`, alongside the
+    groundness information for all the containers within it.
+
+    Since the variables in a mutable container (or a custom term) can change,
+    ``None`` is returned--and cached--when `t` isn't made entirely of atoms,
+    logic variables and immutable containers.
+    """
+    res = tcache.get(t)
+
+    if res is not None and len(res) > 1:
+        return res[1]
+
+    if _term_ground(t, tcache):
+        return _no_lvars
+
+    cache = _reify._cache
+    lvars = set()
+    todo = [t]
+
+    while todo:
+        x = todo.pop()
+
+        if isvar(x):
+            lvars.add(x)
+            continue
+        elif type(x) is HashConsedTuple and x.ground:
+            continue
+
+        types = (type(x), dict)
+        func = cache.get(types) or _reify.dispatch(*types)
+
+        if func is _reify_object:
+            continue
+
+        children = _term_children(x, func)
+
+        if children is None or not children[1]:
+            lvars = None
+            break
+
+        res = tcache.get(x)
+
+        if res is not None and res[0]:
+            continue
+        elif res is not None and len(res) > 1:
+            if res[1] is None:
+                lvars = None
+                break
+            lvars.update(res[1])
+        else:
+            todo.extend(children[0])
+
+    res = None if lvars is None else frozenset(lvars)
+    tcache.set(t, (False, res))
+
+    return res
+
+
+def _slice_from_args(args):
+    return slice(*args)
+
+
+class _ReifyBuild(object):
+    """An instruction to construct a reified `term` from its reified `children`.
+
+    The reified children are the last ``len(children)`` reified elements.
+    """
+
+    __slots__ = ("term", "ctor", "children", "mapping")
+
+    def __init__(self, term, ctor, children, mapping=False):
+        self.term = term
+        self.ctor = ctor
+        self.children = children
+        self.mapping = mapping
+
+
+def _reify_iter(e, s, dag=False):
+    """Reify `e` using an explicit stack of pending terms and constructions.
+
+    Terms handled by the `_reify` implementations in this module are reified
+    inline, and the containers are constructed bottom-up from a stack of
+    reified elements; any other `_reify` implementation is evaluated like
+    `stream_eval`.  Like `stream_eval`, this isn't limited by the recursion
+    limit.
+
+    This is a generator that's driven by a `Continuation`: it first yields
+    to receive a budget of steps, and it yields again whenever the budget runs
+    out.  The reified term is its return value.
+
+    Containers with no reified elements that differ (by identity) from the
+    originals aren't reconstructed; the original containers are used instead.
+    Likewise, ground `HashConsedTuple`s are used as-is, without traversing them.
+
+    When `dag` is ``True``, the reified containers are memoized by identity, so
+    that shared subterms are only reified once (and their reifications are
+    shared, too).
+    """
+    cache = _reify._cache
+    tcache = _cache_module._term_cache
+    memo = {} if dag else None
+    todo = [e]
+    out = []
+
+    max_steps = yield
+    steps = -1 if max_steps is None else max_steps
+
+    while todo:
+        if steps == 0:
+            max_steps = yield
+            steps = -1 if max_steps is None else max_steps
+
+        steps -= 1
+        t = todo.pop()
+        t_type = type(t)
+
+        if memo is not None and id(t) in memo:
+            entry = memo[id(t)]
+            if entry[0] is t:
+                out.append(entry[1])
+                continue
+
+        if t_type is _ReifyBuild:
+            children = t.children
+            n = len(children)
+            if n:
+                args = out[-n:]
+                del out[-n:]
+            else:
+                args = []
+
+            if t.ctor is not iter and all(map(is_, args, children)):
+                res = t.term
+            elif t.mapping:
+                res = t.ctor(zip(args[::2], args[1::2]))
+            else:
+                res = t.ctor(args)
+
+            if memo is not None:
+                memo[id(t.term)] = (t.term, res)
+
+            out.append(res)
+            continue
+
+        if t_type is HashConsedTuple and t.ground:
+            out.append(t)
+            continue
+
+        types = (t_type, type(s))
+        func = cache.get(types) or _reify.dispatch(*types)
+
+        if func is _reify_object:
+            out.append(t)
+
+        elif func is _reify_Var:
+            t_w = walk(t, s)
+
+            if t_w is t:
+                out.append(t)
+            else:
+                todo.append(t_w)
+
+        elif func is _reify_Var_normalized:
+            out.append(s.get(t, t))
+
+        elif (
+            tcache is not None
+            and _is_immutable_container(t, func)
+            and _term_ground(t, tcache)
+        ):
+            out.append(t)
+
+        elif func in _reify_ctors:
+            ctor, mapping = _reify_ctors[func]
+
+            if mapping:
+                children = [c for item in t.items() for c in item]
+            else:
+                children = list(t)
+
+            todo.append(_ReifyBuild(t, ctor, children, mapping))
+            todo.extend(reversed(children))
+
+        elif func is _reify_slice:
+            todo.append(_ReifyBuild(t, _slice_from_args, (t.start, t.stop, t.step)))
+            todo.append(t.step)
+            todo.append(t.stop)
+            todo.append(t.start)
+
+        else:
+            res, steps = yield from _stream_eval_steps(func(t, s), steps)
+
+            if memo is not None:
+                memo[id(t)] = (t, res)
+
+            out.append(res)
+
+    return out[0]
 
 
 @dispatch(object, Mapping)
-def reify(e, s):
+def reify(e, s, dag=False, max_steps=None):
     """Replace logic variables in a term, `e`, with their substitutions in `s`.
 
     >>> x, y = var(), var()
@@ -142,12 +600,263 @@ def reify(e, s):
     >>> e = {1: x, 3: (y, 5)}
     >>> reify(e, s)
     {1: 2, 3: (4, 5)}
+
+    When `dag` is ``True``, subterms that are shared (i.e. the same objects
+    reached through different paths) are only reified once, and their
+    reifications are shared in the result.
+
+    When `max_steps` is given, `StepLimitExceeded` is raised after that many
+    steps (roughly, subterms visited), with a continuation that can be used to
+    resume the computation.
     """
+    _check_max_steps(max_steps)
 
     if len(s) == 0:
         return e
 
-    return stream_eval(_reify(e, s))
+    return Continuation(_reify_iter(e, s, dag)).resume(max_steps)
+
+
+def normalize(s):
+    """Resolve every binding in `s` to its fully reified value.
+
+    Each binding is reified only once--in dependency order, and against the
+    bindings that have already been resolved--so the cost is roughly linear
+    in the total size of the bound terms.  The result is a
+    `NormalizedSubstitution`, for which `reify` only needs a single lookup per
+    variable.
+
+    >>> x, y, z = var('x'), var('y'), var('z')
+    >>> normalize({x: (1, y), y: z, z: 2})
+    NormalizedSubstitution({~x: (1, 2), ~y: 2, ~z: 2})
+    """
+    if isinstance(s, NormalizedSubstitution):
+        return s
+
+    res = NormalizedSubstitution()
+    path = set()
+    memo = {}
+
+    for key in s:
+        if key in res:
+            continue
+
+        stack = [(key, iter(_structural_lvars(s[key], memo)))]
+        path.add(key)
+
+        while stack:
+            k, deps = stack[-1]
+
+            for lv in deps:
+                if lv in s and lv not in res:
+                    if lv in path:
+                        raise ValueError(f"Cyclic binding for {lv} in substitution")
+                    path.add(lv)
+                    stack.append((lv, iter(_structural_lvars(s[lv], memo))))
+                    break
+            else:
+                res[k] = reify(s[k], res)
+                path.discard(k)
+                stack.pop()
+
+    return NormalizedSubstitution((k, res[k]) for k in s)
+
+
+# The instructions of the postfix programs compiled by `_compile_renaming`.
+_RENAME_CONST, _RENAME_VAR, _RENAME_BUILD, _RENAME_REIFY = range(4)
+
+# The compiled renaming programs of immutable terms (see `rename_apart`).
+_rename_templates = IdentityCache(maxsize=2**10)
+
+
+def _mapping_from_args(ctor, args):
+    return ctor(zip(args[::2], args[1::2]))
+
+
+def _term_info(t, memo, lvars_memo):
+    """Determine whether `t` contains logic variables and whether it's immutable.
+
+    The ``(term, has_lvars, immutable)`` results for `t` and every container
+    within it are stored in `memo` by identity.  A term is immutable when it
+    only consists of atoms, logic variables and immutable containers.
+    """
+    cache = _reify._cache
+    # The entries are `(term, None)` for terms to visit, and `(term, (n,
+    # immutable))` for containers with `n` children that have been visited.
+    todo = [(t, None)]
+    out = []
+
+    while todo:
+        x, build = todo.pop()
+
+        if build is not None:
+            n, immutable = build
+            children = out[-n:] if n else []
+            if n:
+                del out[-n:]
+            res = (
+                x,
+                any(c[1] for c in children),
+                immutable and all(c[2] for c in children),
+            )
+            memo[id(x)] = res
+            out.append(res)
+            continue
+
+        entry = memo.get(id(x))
+
+        if entry is not None and entry[0] is x:
+            out.append(entry)
+            continue
+
+        if isvar(x):
+            out.append((x, True, True))
+            continue
+        elif type(x) is HashConsedTuple and x.ground:
+            out.append((x, False, True))
+            continue
+
+        types = (type(x), dict)
+        func = cache.get(types) or _reify.dispatch(*types)
+
+        if func is _reify_object:
+            out.append((x, False, True))
+            continue
+
+        children = _term_children(x, func)
+
+        if children is None:
+            res = (x, bool(_structural_lvars(x, lvars_memo)), False)
+            memo[id(x)] = res
+            out.append(res)
+        else:
+            children, immutable = children
+            todo.append((x, (len(children), immutable)))
+            todo.extend((c, None) for c in children)
+
+    return out[0]
+
+
+def _compile_renaming(t):
+    """Compile a postfix program that constructs renamed copies of `t`.
+
+    Returns the program, the logic variables of `t` (in order of first
+    occurrence) and whether or not the program can be reused for `t`.
+    """
+    cache = _reify._cache
+    memo = {}
+    lvars_memo = {}
+    _, _, immutable = _term_info(t, memo, lvars_memo)
+    lvars = {}
+    ops = []
+    # The entries are `(term, None)` for terms to compile, and `(None, op)`
+    # for instructions that construct containers from their compiled children.
+    todo = [(t, None)]
+
+    while todo:
+        x, op = todo.pop()
+
+        if op is not None:
+            ops.append(op)
+            continue
+
+        if isvar(x):
+            ops.append((_RENAME_VAR, lvars.setdefault(x, len(lvars))))
+            continue
+
+        entry = memo.get(id(x))
+
+        if entry is None or entry[0] is not x or not entry[1]:
+            # Ground subterms are shared by all the copies.
+            ops.append((_RENAME_CONST, x))
+            continue
+
+        types = (type(x), dict)
+        func = cache.get(types) or _reify.dispatch(*types)
+        children = _term_children(x, func)
+
+        if children is None:
+            for lv in _structural_lvars(x, lvars_memo):
+                lvars.setdefault(lv, len(lvars))
+            ops.append((_RENAME_REIFY, x))
+            continue
+
+        children = list(children[0])
+
+        if func is _reify_slice:
+            ctor = _slice_from_args
+        else:
+            ctor, mapping = _reify_ctors[func]
+            if mapping:
+                ctor = partial(_mapping_from_args, ctor)
+
+        todo.append((None, (_RENAME_BUILD, ctor, len(children))))
+        todo.extend((c, None) for c in reversed(children))
+
+    reusable = immutable and not _variable_module._active_scopes
+
+    return ops, tuple(lvars), reusable
+
+
+def rename_apart(t, new_var=fresh):
+    """Replace the logic variables in `t` with new ones.
+
+    Every occurrence of a variable is replaced by the same new variable, which
+    is created by calling `new_var`; ground subterms aren't copied.  To rename
+    several terms consistently, rename a tuple containing them.
+
+    >>> x, y = var('x'), var('y')
+    >>> pattern = (x, (1, 2), (y, x))
+    >>> renamed = rename_apart(pattern)
+    >>> renamed[0] is renamed[2][1], renamed[0] == x, renamed[1] is pattern[1]
+    (True, False, True)
+
+    The renaming of a term that only consists of atoms, logic variables and
+    immutable containers (e.g. `tuple`s) is compiled once and cached, so that
+    renaming the same term again only takes a single pass over its copy.
+    """
+    # The objects passed to `variables` depend on the context, so cached
+    # renamings can't be used within a scope.
+    if _variable_module._active_scopes:
+        template = _compile_renaming(t)
+    else:
+        template = _rename_templates.get(t)
+
+        if template is None:
+            template = _compile_renaming(t)
+            if template[2]:
+                _rename_templates.set(t, template)
+
+    ops, lvars, _ = template
+
+    if not lvars:
+        return t
+
+    new = [new_var() for _ in lvars]
+    s = None
+    out = []
+
+    for op in ops:
+        code = op[0]
+
+        if code == _RENAME_CONST:
+            out.append(op[1])
+        elif code == _RENAME_VAR:
+            out.append(new[op[1]])
+        elif code == _RENAME_BUILD:
+            n = op[2]
+            if n:
+                args = out[-n:]
+                del out[-n:]
+            else:
+                args = []
+            out.append(op[1](args))
+        else:
+            if s is None:
+                s = dict(zip(lvars, new))
+            out.append(reify(op[1], s))
+
+    return out[0]
 
 
 @dispatch(object, object, Mapping)
@@ -235,35 +944,642 @@ def _unify_slice(u, v, s):
     s = yield _unify(u.step, v.step, s)
 
 
+_unify_object = _unify.dispatch(object, object, Mapping)
+
+# The default for `unify`'s `occurs_check` argument.
+default_occurs_check = False
+
+
+def _structural_lvars(t, memo):
+    """Return the logic variables that occur in `t`, ignoring any substitution.
+
+    The results for `t` and the containers within it are stored in `memo` by
+    identity, so shared subterms are only traversed once per `memo`.
+    Iterators are never traversed, since that would consume them.
+    """
+    entry = memo.get(id(t))
+
+    if entry is not None and entry[0] is t:
+        return entry[1]
+
+    cache = _reify._cache
+    todo = [(t, None)]
+    out = []
+
+    while todo:
+        x, n = todo.pop()
+
+        if n is not None:
+            lvars = _no_lvars
+
+            if n:
+                children = [c for c in out[-n:] if c]
+                del out[-n:]
+
+                if len(children) == 1:
+                    lvars = children[0]
+                elif children:
+                    lvars = _no_lvars.union(*children)
+
+            memo[id(x)] = (x, lvars)
+            out.append(lvars)
+            continue
+
+        if isvar(x):
+            out.append(frozenset((x,)))
+            continue
+        elif type(x) is HashConsedTuple and x.ground:
+            out.append(_no_lvars)
+            continue
+
+        entry = memo.get(id(x))
+
+        if entry is not None and entry[0] is x:
+            out.append(entry[1])
+            continue
+
+        types = (type(x), dict)
+        func = cache.get(types) or _reify.dispatch(*types)
+
+        if func is _reify_object:
+            out.append(_no_lvars)
+            continue
+
+        children = _term_children(x, func)
+
+        if children is None:
+            out.append(frozenset(_unground_lvars_iter(x, {})))
+        else:
+            children = children[0]
+            todo.append((x, len(children)))
+            todo.extend((c, None) for c in children)
+
+    return out[0]
+
+
+def _free_lvars(v, s, memo, free):
+    """Return the unbound logic variables that the bound variable `v` reaches.
+
+    `free` maps bound variables to the variables that they reached when they
+    were last visited; since bindings are only ever added, the variables in
+    those sets that have been bound since then are expanded (and the sets are
+    updated), instead of walking the bindings again.
+    """
+    resolved = {}
+    visiting = {v}
+    stack = [v]
+
+    while stack:
+        u = stack[-1]
+        lvars = free.get(u)
+
+        if lvars is None:
+            lvars = free[u] = _structural_lvars(s[u], memo)
+
+        pending = [
+            w for w in lvars if w not in resolved and w not in visiting and w in s
+        ]
+
+        if pending:
+            visiting.update(pending)
+            stack.extend(pending)
+            continue
+
+        bound = [w for w in lvars if w in resolved]
+
+        if bound:
+            lvars = lvars.difference(bound).union(*(resolved[w] for w in bound))
+            free[u] = lvars
+
+        resolved[u] = lvars
+        visiting.discard(u)
+        stack.pop()
+
+    return resolved[v]
+
+
+def occurs(x, t, s, memo=None, free=None):
+    """Determine whether the unbound logic variable `x` occurs in `t` under `s`.
+
+    Only the variables in `t` (and in the values they're bound to) are
+    visited.  The variables in each term are collected once per `memo`, and
+    the unbound variables reached by each bound variable are collected once
+    per `free`; both can be reused as long as bindings are only added to `s`.
+
+    >>> x, y = var('x'), var('y')
+    >>> occurs(x, (1, y), {y: (2, x)})
+    True
+    >>> occurs(x, (1, y), {})
+    False
+    """
+    if memo is None:
+        memo = {}
+    if free is None:
+        free = {}
+
+    lvars = (t,) if isvar(t) else _structural_lvars(t, memo)
+
+    for v in lvars:
+        if v == x:
+            return True
+        elif v in s and x in _free_lvars(v, s, memo, free):
+            return True
+
+    return False
+
+
+# The sequence types that are fingerprinted, and the kinds of sequences they're
+# unified as.
+_fingerprint_kinds = {tuple: tuple, HashConsedTuple: tuple, list: list}
+
+# A fingerprint element for a position that doesn't hold a constant.
+_wildcard = object()
+
+# The minimum length of the sequences that `unify` compares by fingerprint
+# before unifying them.  Shorter sequences are unified about as quickly as
+# their fingerprints are computed, and only longer ones save much when their
+# fingerprints are incompatible.
+fingerprint_min_size = 16
+
+
+def fingerprint(t, k=3):
+    """Compute a structural fingerprint for `t`.
+
+    The fingerprint of a `tuple` or `list` consists of its kind of sequence,
+    its length and a summary of each of its first `k` elements: constants (i.e.
+    ground atoms and ground hash-consed tuples) are included as-is, and other
+    sequences are represented by their kinds.  Other terms have no
+    fingerprint (i.e. ``None``).  Terms whose fingerprints aren't compatible
+    can't be unified.
+
+    >>> x = var('x')
+    >>> fingerprint((1, [x], "a", 2))[:4]
+    (<class 'tuple'>, 4, 1, <class 'list'>)
+    >>> fingerprint(x) is None
+    True
+    """
+    kind = _fingerprint_kinds.get(type(t))
+
+    if kind is None:
+        return None
+
+    res = [kind, len(t)]
+
+    for c in t[:k]:
+        c_type = type(c)
+
+        if isvar(c):
+            res.append(_wildcard)
+        elif c_type in _ground_types or (c_type is HashConsedTuple and c.ground):
+            res.append(c)
+        elif c_type in _fingerprint_kinds:
+            res.append(_fingerprint_kinds[c_type])
+        else:
+            res.append(_wildcard)
+
+    return tuple(res)
+
+
+def _fingerprints_compatible(a, b):
+    """Determine whether terms with the fingerprints `a` and `b` could unify."""
+    if a is None or b is None:
+        return True
+
+    if a[0] is not b[0] or a[1] != b[1]:
+        return False
+
+    for x, y in zip(a[2:], b[2:]):
+        if x is _wildcard or y is _wildcard or x is y:
+            continue
+        elif type(x) is type or type(y) is type:
+            # At least one of the elements is a sequence that isn't constant.
+            x_kind = _fingerprint_kinds.get(type(x), x)
+            if x_kind is not _fingerprint_kinds.get(type(y), y):
+                return False
+        elif x != y:
+            return False
+
+    return True
+
+
+def _has_cheap_mismatch(pairs, s):
+    """Determine whether any of the `pairs` of terms obviously can't unify.
+
+    Only checks that don't add bindings or traverse subterms are made: atoms
+    (including the values that variables are already bound to) are compared
+    with ``==``, and sequences and mappings are compared by their lengths.
+    """
+    cache = _unify._cache
+
+    for u, v in pairs:
+        if isvar(u):
+            u = walk(u, s)
+            if isvar(u):
+                continue
+
+        if isvar(v):
+            v = walk(v, s)
+            if isvar(v):
+                continue
+
+        if u is v:
+            continue
+
+        types = (type(u), type(v), type(s))
+        func = cache.get(types) or _unify.dispatch(*types)
+
+        if func is _unify_object:
+            if not u == v:
+                return True
+        elif func is _unify_Iterable:
+            if (
+                type(u) is HashConsedTuple
+                and type(v) is HashConsedTuple
+                and u.ground
+                and v.ground
+            ):
+                if not u == v:
+                    return True
+            elif length_hint(u, -1) != length_hint(v, -1):
+                return True
+        elif func is _unify_Mapping:
+            if len(u) != len(v):
+                return True
+
+    return False
+
+
+class _UnboundView(object):
+    """A view of the substitution `s` without the bindings of `keys`."""
+
+    __slots__ = ("s", "keys")
+
+    def __init__(self, s, keys):
+        self.s = s
+        self.keys = keys
+
+    def __contains__(self, key):
+        return key not in self.keys and key in self.s
+
+    def __getitem__(self, key):
+        if key in self.keys:
+            raise KeyError(key)
+        return self.s[key]
+
+
+# Whether `dict`s can be iterated in reverse (i.e. Python >= 3.8).
+_dicts_reversible = hasattr(dict, "__reversed__")
+
+
+def _bindings_snapshot(s):
+    """Record what `_added_keys` needs to know about `s` before it's extended."""
+    if isinstance(s, (Substitution, LayeredSubstitution)) or (
+        isinstance(s, dict) and _dicts_reversible
+    ):
+        return len(s), None
+    elif isinstance(s, ArraySubstitution):
+        return len(s), s.checkpoint()
+    else:
+        return len(s), set(s)
+
+
+def _added_keys(s, res, snapshot):
+    """Return the keys that were added to `s` to get `res`.
+
+    Only the new bindings are visited for the substitution types in this
+    package; the keys of other mappings are compared to a copy of the
+    original keys made by `_bindings_snapshot`.
+    """
+    size, extra = snapshot
+    n = len(res) - size
+
+    if n <= 0:
+        return ()
+    elif type(extra) is set:
+        return [k for k in res if k not in extra]
+    elif isinstance(res, dict) and isinstance(s, dict):
+        # Bindings are only ever added, so the new keys come last.
+        return list(islice(reversed(res), n))
+    elif isinstance(res, Substitution) and isinstance(s, Substitution):
+        return res._keys_not_in(s)
+    elif (
+        type(res) is LayeredSubstitution
+        and type(s) is LayeredSubstitution
+        and res.parent is s.parent
+    ):
+        return [k for k in res.bindings._keys_not_in(s.bindings) if k not in s]
+    elif res is s and extra is not None:
+        return [k for k, old in s._trail[extra:] if old is _missing]
+    else:
+        return [k for k in res if k not in s]
+
+
+def _unify_iter(u, v, s, occurs_check=False, dag=False, fail_fast=False):
+    """Unify `u` and `v` using an explicit stack of term pairs.
+
+    The cases handled by the `_unify` implementations in this module (i.e.
+    logic variables and the built-in containers) are evaluated inline, without
+    creating generators; any other `_unify` implementation is evaluated like
+    `stream_eval`.  Like `stream_eval`, this isn't limited by the recursion
+    limit.
+
+    Like `_reify_iter`, this is a generator that's driven by a `Continuation`;
+    the unified substitution (or ``False``) is its return value.
+
+    Pairs of ground `HashConsedTuple`s are unified by equality, without
+    traversing them.
+
+    When `occurs_check` is ``True``, a variable isn't bound to a term that
+    contains it.  The bindings added by other `_unify` implementations are
+    checked after they're evaluated.
+
+    When `dag` is ``True``, each pair of compound terms is only unified once;
+    when the same pair (by identity) is reached again, its unification already
+    holds under `s`.
+
+    When `fail_fast` is ``True``, the elements of sequences and mappings are
+    checked for cheap mismatches (see `_has_cheap_mismatch`) before they're
+    unified in order.
+    """
+    cache = _unify._cache
+    tcache = _cache_module._term_cache
+    memo = {} if occurs_check else None
+    free = {} if occurs_check else None
+    # The visited pairs are kept alive, so that their `id`s can't be reused.
+    visited = {} if dag else None
+    stack = [(u, v)]
+
+    max_steps = yield
+    steps = -1 if max_steps is None else max_steps
+
+    while stack:
+        if steps == 0:
+            max_steps = yield
+            steps = -1 if max_steps is None else max_steps
+
+        steps -= 1
+        u, v = stack.pop()
+
+        if u is v:
+            continue
+        elif (
+            type(u) is HashConsedTuple
+            and type(v) is HashConsedTuple
+            and u.ground
+            and v.ground
+        ):
+            # Ground hash-consed terms are unified by equality, which usually
+            # only compares their cached hashes.
+            if u == v:
+                continue
+            return False
+
+        types = (type(u), type(v), type(s))
+        func = cache.get(types) or _unify.dispatch(*types)
+
+        if (
+            visited is not None
+            and func is not _unify_Var_object
+            and func is not _unify_object
+        ):
+            key = (id(u), id(v))
+            if key in visited:
+                continue
+            visited[key] = (u, v)
+
+        if func is _unify_Var_object:
+            u_w = walk(u, s)
+
+            if isvar(v):
+                v_w = walk(v, s)
+            else:
+                v_w = v
+
+            if u_w == v_w:
+                continue
+            elif isvar(u_w):
+                if occurs_check and not isvar(v_w) and occurs(u_w, v_w, s, memo, free):
+                    return False
+                s = assoc(s, u_w, v_w)
+            elif isvar(v_w):
+                if occurs_check and occurs(v_w, u_w, s, memo, free):
+                    return False
+                s = assoc(s, v_w, u_w)
+            else:
+                stack.append((u_w, v_w))
+
+        elif func is _unify_object:
+            if u == v:
+                continue
+            return False
+
+        elif func is _unify_Iterable:
+            if length_hint(u, -1) != length_hint(v, -1):
+                return False
+
+            if (
+                tcache is not None
+                and type(u) is tuple
+                and type(v) is tuple
+                and _term_ground(u, tcache)
+                and _term_ground(v, tcache)
+            ):
+                if u == v:
+                    continue
+                return False
+
+            pairs = list(zip(u, v))
+
+            if fail_fast and _has_cheap_mismatch(pairs, s):
+                return False
+
+            pairs.reverse()
+            stack.extend(pairs)
+
+        elif func is _unify_Mapping:
+            if len(u) != len(v):
+                return False
+
+            pairs = []
+            for key, uval in u.items():
+                if key not in v:
+                    return False
+                pairs.append((uval, v[key]))
+
+            if fail_fast and _has_cheap_mismatch(pairs, s):
+                return False
+
+            pairs.reverse()
+            stack.extend(pairs)
+
+        elif func is _unify_slice:
+            stack.append((u.step, v.step))
+            stack.append((u.stop, v.stop))
+            stack.append((u.start, v.start))
+
+        elif func is _unify_Set:
+            i = u & v
+            stack.append((iter(u - i), iter(v - i)))
+
+        else:
+            if occurs_check:
+                old_s, snapshot = s, _bindings_snapshot(s)
+
+            s, steps = yield from _stream_eval_steps(func(u, v, s), steps)
+
+            if s is False:
+                return False
+
+            if occurs_check:
+                # The new bindings are checked as if they were added one at a
+                # time, so the variables reached under `s` stay cacheable.
+                unchecked = set(_added_keys(old_s, s, snapshot))
+                view = _UnboundView(s, unchecked)
+
+                for k in list(unchecked):
+                    if occurs(k, s[k], view, memo, free):
+                        return False
+                    unchecked.discard(k)
+
+    return s
+
+
 @dispatch(object, object, Mapping)
-def unify(u, v, s):
+def unify(
+    u,
+    v,
+    s,
+    delta=False,
+    occurs_check=None,
+    dag=False,
+    fail_fast=False,
+    max_steps=None,
+):
     """Find substitution so that ``u == v`` while satisfying `s`.
 
     >>> x = var('x')
     >>> unify((1, x), (1, 2), {})
     {~x: 2}
+
+    When `delta` is ``True``, `s` is left untouched and only the bindings
+    added by this unification are returned.  The new bindings are collected in
+    a `LayeredSubstitution` over `s`, so `s` itself is never copied.
+
+    >>> y = var('y')
+    >>> unify((x, y), (1, 2), {x: 1}, delta=True)
+    {~y: 2}
+
+    When `occurs_check` is ``True``, unification fails instead of binding a
+    variable to a term that contains it (i.e. instead of creating a cyclic
+    substitution).  It defaults to `default_occurs_check`.
+
+    >>> unify(x, (1, x), {}, occurs_check=True)
+    False
+
+    When `dag` is ``True``, subterms that are shared (i.e. the same objects
+    reached through different paths) are only unified once, so the cost is
+    linear in the number of distinct pairs of subterms instead of the size of
+    the terms as trees.
+
+    When `fail_fast` is ``True``, the cheap elements of each sequence and
+    mapping (e.g. atoms, and variables bound to atoms) are compared before any
+    of the elements are unified, so that a mismatch is found before
+    descending into the other elements.  The resulting substitution is the
+    same.
+
+    When `max_steps` is given, `StepLimitExceeded` is raised after that many
+    steps (roughly, pairs of subterms visited), with a continuation that can be
+    used to resume the computation.
     """
+    _check_max_steps(max_steps)
+
+    if occurs_check is None:
+        occurs_check = default_occurs_check
+
+    if delta:
+        try:
+            res = unify(
+                u,
+                v,
+                LayeredSubstitution(s),
+                occurs_check=occurs_check,
+                dag=dag,
+                fail_fast=fail_fast,
+                max_steps=max_steps,
+            )
+        except StepLimitExceeded as e:
+            e.continuation._then(_bindings)
+            raise
+
+        return _bindings(res)
+
     if u is v:
         return s
 
-    return stream_eval(_unify(u, v, s))
+    if (
+        type(u) in _fingerprint_kinds
+        and len(u) >= fingerprint_min_size
+        and not _fingerprints_compatible(fingerprint(u), fingerprint(v))
+        and _unify.dispatch(type(u), type(v), type(s)) is _unify_Iterable
+    ):
+        return False
+
+    return Continuation(_unify_iter(u, v, s, occurs_check, dag, fail_fast)).resume(
+        max_steps
+    )
+
+
+def _bindings(res):
+    return res if res is False else dict(res.bindings.items())
 
 
 @unify.register(object, object)
-def unify_NoMap(u, v):
-    return unify(u, v, {})
+def unify_NoMap(u, v, **kwargs):
+    return unify(u, v, {}, **kwargs)
 
 
-def unground_lvars(u, s):
-    """Return the unground logic variables from a term and state."""
+def unify_inplace(u, v, s, **kwargs):
+    """Unify `u` and `v` by adding bindings directly to `s`.
 
-    lvars = set()
+    `s` must support ``checkpoint``/``rollback`` (e.g. a `TrailSubstitution`).
+    When unification fails, the bindings added during the attempt are rolled
+    back, so that `s` is left exactly as it was.  Keyword arguments are passed
+    to `unify`.
+
+    >>> x = var('x')
+    >>> s = TrailSubstitution()
+    >>> unify_inplace((1, x, 3), (1, 2, 4), s)
+    False
+    >>> s
+    TrailSubstitution({})
+    >>> unify_inplace((1, x), (1, 2), s)
+    TrailSubstitution({~x: 2})
+    """
+    mark = s.checkpoint()
+
+    def finish(res):
+        if res is False:
+            s.rollback(mark)
+        return res
+
+    try:
+        res = unify(u, v, s, **kwargs)
+    except StepLimitExceeded as e:
+        e.continuation._then(finish)
+        raise
+
+    return finish(res)
+
+
+def _stream_unground_lvars(u, s, lvars, first=False):
+    """Add the unground logic variables in `u` to `lvars` using `stream_eval`."""
 
     def lvar_filter(z, r):
-        nonlocal lvars
 
         if isvar(r):
             lvars.add(r)
+            if first:
+                raise UngroundLVarException()
 
         if r is construction_sentinel:
             z.close()
@@ -272,31 +1588,80 @@ def unground_lvars(u, s):
             raise StopIteration()
 
     z = _reify(u, s)
-    stream_eval(z, lvar_filter)
 
-    return lvars
+    try:
+        stream_eval(z, lvar_filter)
+    except UngroundLVarException:
+        pass
 
 
-def isground(u, s):
-    """Determine whether or not `u` contains an unground logic variable under mappings `s`."""  # noqa: E501
+def _unground_lvars_iter(u, s, first=False):
+    """Collect the unground logic variables in `u` using an explicit stack.
 
-    def lvar_filter(z, r):
+    When `first` is ``True``, the search stops after the first one is found.
+    Like `_reify_iter`, only the terms handled by the `_reify` implementations
+    in this module are traversed inline.
+    """
+    cache = _reify._cache
+    tcache = _cache_module._term_cache
+    lvars = set()
+    todo = [u]
 
-        if isvar(r):
-            raise UngroundLVarException()
-        elif r is construction_sentinel:
-            z.close()
+    while todo:
+        t = todo.pop()
+        t_type = type(t)
 
-            # Remove this generator from the stack.
-            raise StopIteration()
+        if t_type is HashConsedTuple and t.ground:
+            continue
 
-    try:
-        z = _reify(u, s)
-        stream_eval(z, lvar_filter)
-    except UngroundLVarException:
-        return False
+        types = (t_type, type(s))
+        func = cache.get(types) or _reify.dispatch(*types)
 
-    return True
+        if func is _reify_object:
+            continue
+
+        elif func is _reify_Var or func is _reify_Var_normalized:
+            t_w = walk(t, s) if func is _reify_Var else s.get(t, t)
+
+            if isvar(t_w):
+                lvars.add(t_w)
+                if first:
+                    break
+            elif t_w is not t:
+                todo.append(t_w)
+
+        elif func in _reify_ctors or func is _reify_slice:
+            t_lvars = None
+
+            if tcache is not None and _is_immutable_container(t, func):
+                t_lvars = _term_lvars(t, tcache)
+
+            if t_lvars is not None:
+                # Only visit the variables that occur in `t`.
+                todo.extend(t_lvars)
+            elif func is _reify_slice:
+                todo.extend((t.start, t.stop, t.step))
+            elif _reify_ctors[func][1]:
+                todo.extend(c for item in t.items() for c in item)
+            else:
+                todo.extend(t)
+
+        else:
+            _stream_unground_lvars(t, s, lvars, first)
+            if first and lvars:
+                break
+
+    return lvars
+
+
+def unground_lvars(u, s):
+    """Return the unground logic variables from a term and state."""
+    return _unground_lvars_iter(u, s)
+
+
+def isground(u, s):
+    """Determine whether or not `u` contains an unground logic variable under mappings `s`."""  # noqa: E501
+    return not _unground_lvars_iter(u, s, first=True)
 
 
 def debug_unify(u, v, s):  # pragma: no cover
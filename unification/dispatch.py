@@ -1,7 +1,130 @@
-from functools import partial
-
-from multipledispatch import dispatch
+from itertools import product
 
 namespace = dict()
 
-dispatch = partial(dispatch, namespace=namespace)
+
+class Dispatcher(object):
+    """A function that dispatches on the types of its positional arguments.
+
+    Implementations are resolved once per tuple of concrete argument types and
+    cached; the cache is cleared whenever an implementation is added.
+
+    Among the registered signatures that match a tuple of types, the one whose
+    types are all subclasses of the others' is used.  Ambiguities are resolved
+    in favor of the most recently registered signature.
+
+    >>> f = Dispatcher('f')
+    >>> @f.register(object)
+    ... def f_object(x):
+    ...     return 'object'
+    >>> @f.register(int)
+    ... def f_int(x):
+    ...     return 'int'
+    >>> f(1), f(True), f('a')
+    ('int', 'int', 'object')
+    """
+
+    def __init__(self, name, doc=None):
+        self.name = self.__name__ = name
+        self.__doc__ = doc
+        self.funcs = {}
+        self._cache = {}
+
+    def add(self, signature, func):
+        """Register an implementation for a signature.
+
+        The entries of `signature` can also be tuples of types, in which case
+        `func` is registered for every combination of their types.
+        """
+        signature = tuple(signature)
+
+        if any(isinstance(t, tuple) for t in signature):
+            for sig in product(
+                *(t if isinstance(t, tuple) else (t,) for t in signature)
+            ):
+                self.add(sig, func)
+            return
+
+        # Re-registering a signature moves it to the end of the resolution order.
+        self.funcs.pop(signature, None)
+        self.funcs[signature] = func
+        self._cache.clear()
+
+    def register(self, *types):
+        """Create a decorator that registers a function for `types`."""
+
+        def _(func):
+            self.add(types, func)
+            return func
+
+        return _
+
+    def dispatch(self, *types):
+        """Return the implementation for the argument types `types`, if any."""
+        try:
+            return self._cache[types]
+        except KeyError:
+            func = self._cache[types] = self._resolve(types)
+            return func
+
+    def _resolve(self, types):
+        n = len(types)
+        matches = [
+            sig
+            for sig in self.funcs
+            if len(sig) == n and all(map(issubclass, types, sig))
+        ]
+        best = [
+            sig
+            for sig in matches
+            if not any(_supercedes(other, sig) for other in matches)
+        ]
+
+        if not best:
+            return None
+
+        return self.funcs[best[-1]]
+
+    def __call__(self, *args, **kwargs):
+        n = len(args)
+        if n == 2:
+            types = (type(args[0]), type(args[1]))
+        elif n == 3:
+            types = (type(args[0]), type(args[1]), type(args[2]))
+        else:
+            types = tuple([type(arg) for arg in args])
+
+        func = self._cache.get(types) or self.dispatch(*types)
+
+        if func is None:
+            raise NotImplementedError(
+                f"Could not find signature for {self.name}: "
+                f"<{', '.join(t.__name__ for t in types)}>"
+            )
+
+        return func(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<dispatched {self.name}>"
+
+
+def _supercedes(a, b):
+    """Determine whether signature `a` is strictly more specific than `b`."""
+    return a != b and all(map(issubclass, a, b))
+
+
+def dispatch(*types, namespace=namespace):
+    """Create a decorator that adds a function to the `Dispatcher` of the same name."""  # noqa: E501
+
+    def _(func):
+        name = func.__name__
+
+        if name not in namespace:
+            namespace[name] = Dispatcher(name, doc=func.__doc__)
+
+        d = namespace[name]
+        d.add(types, func)
+
+        return d
+
+    return _
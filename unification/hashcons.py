@@ -0,0 +1,258 @@
+"""Hash-consed terms.
+
+`hashcons` returns a canonical version of a term, in which every tuple (or
+list, which is converted to a tuple) is replaced by the one `HashConsedTuple`
+object with the same elements (of the same types).  Hash-consed tuples that
+are the same object are equal, and most of the unequal ones are told apart by
+their cached hashes, so they can usually be compared--and unified--in
+constant time.
+
+>>> x = var('x')
+>>> a = hashcons((1, [x, "a"], (2, 3)))
+>>> a
+(1, (~x, 'a'), (2, 3))
+>>> b = hashcons((1, (x, "a"), [2, 3]))
+>>> a is b
+True
+
+Hash-consed tuples are held weakly by the table of canonical terms, so they
+are discarded once they're no longer used elsewhere.  When the table is full,
+new terms are returned without being hash-consed.
+"""
+
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+
+from .variable import isvar
+
+# Atom types that can't contain logic variables.
+_ground_types = frozenset({int, float, complex, str, bytes, bool, type(None)})
+
+_slice_marker = object()
+_unhashable_marker = object()
+
+
+class HashConsedTuple(tuple):
+    """A canonical tuple created by `hashcons`.
+
+    Hash-consed tuples compare like tuples, but the same object is equal to
+    itself without comparing the elements, and tuples with different cached
+    hashes are unequal.  Distinct hash-consed tuples can still be equal, since
+    the elements of canonical tuples are compared by type, too (e.g.
+    ``hashcons((1,))`` and ``hashcons((1.0,))``).
+
+    The ``ground`` attribute indicates whether the tuple is known to contain no
+    logic variables.
+    """
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif (
+            type(other) is HashConsedTuple
+            and self._hash is not None
+            and other._hash is not None
+            and self._hash != other._hash
+        ):
+            return False
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            return tuple.__hash__(self)
+        return self._hash
+
+    def __reduce__(self):
+        return hashcons, (tuple(self),)
+
+
+class _Entry(object):
+    """A weakly referenceable table entry for a `HashConsedTuple`.
+
+    `tuple` subclasses can't be referenced weakly, so every hash-consed tuple
+    references its entry, and the table references the entries weakly.  The
+    resulting reference cycle is collected by the garbage collector once the
+    tuple is no longer used.
+    """
+
+    __slots__ = ("term", "__weakref__")
+
+    def __init__(self, term):
+        self.term = term
+
+
+class HashConsTable(object):
+    """A table of canonical terms.
+
+    Tuples are referenced weakly, and at most `maxsize` of them are kept.
+    Slices can't be referenced weakly, so the `slice_maxsize` most recently
+    used ones are kept instead.
+
+    Atoms are compared by type and value (or by identity, when they're not
+    hashable), so, for instance, ``(1,)`` and ``(1.0,)`` aren't hash-consed to
+    the same tuple.
+    """
+
+    def __init__(self, maxsize=2**20, slice_maxsize=2**10):
+        self.maxsize = maxsize
+        self.slice_maxsize = slice_maxsize
+        self._tuples = WeakValueDictionary()
+        self._slices = OrderedDict()
+
+    def __len__(self):
+        return len(self._tuples)
+
+    def cons(self, term):
+        """Return the canonical version of `term`."""
+        # The entries of `out` are `(term, key, ground)` triples, where `key`
+        # identifies a canonical term (or is `None` when there isn't one).
+        out = []
+        memo = {}
+        in_progress = set()
+        stack = [(term, False)]
+
+        while stack:
+            t, expanded = stack.pop()
+            t_type = type(t)
+
+            if expanded:
+                in_progress.discard(id(t))
+                n = 3 if t_type is slice else len(t)
+                children = out[-n:] if n else []
+                if n:
+                    del out[-n:]
+
+                if t_type is slice:
+                    res = self._cons_slice(children)
+                else:
+                    res = self._cons_tuple(children)
+
+                memo[id(t)] = res
+                out.append(res)
+
+            elif t_type is HashConsedTuple:
+                out.append((t, id(t), t.ground))
+
+            elif t_type is tuple or t_type is list or t_type is slice:
+                if id(t) in memo:
+                    out.append(memo[id(t)])
+                    continue
+
+                if id(t) in in_progress:
+                    raise ValueError(f"Cannot hash-cons cyclic term {t!r}")
+
+                in_progress.add(id(t))
+                stack.append((t, True))
+
+                if t_type is slice:
+                    children = (t.start, t.stop, t.step)
+                else:
+                    children = t
+
+                stack.extend((c, False) for c in reversed(children))
+
+            else:
+                out.append(_cons_atom(t))
+
+        return out[0][0]
+
+    def cons_elements(self, items):
+        """Return the canonical tuple with the elements `items`.
+
+        Unlike `cons`, the elements themselves aren't hash-consed: the
+        `HashConsedTuple`s among them are used as they are, and any other
+        tuples, lists and slices are identified by identity.
+        """
+        return self._cons_tuple([_cons_element(c) for c in items])[0]
+
+    def _cons_tuple(self, children):
+        items = tuple(c[0] for c in children)
+        key = tuple(c[1] for c in children)
+        ground = all(c[2] for c in children)
+
+        if None in key:
+            return items, None, ground
+
+        entry = self._tuples.get(key)
+
+        if entry is not None:
+            res = entry.term
+        elif len(self._tuples) >= self.maxsize:
+            return items, None, ground
+        else:
+            res = tuple.__new__(HashConsedTuple, items)
+            try:
+                res._hash = tuple.__hash__(res)
+            except TypeError:
+                res._hash = None
+            res.ground = ground
+            res._entry = self._tuples[key] = _Entry(res)
+
+        return res, id(res), ground
+
+    def _cons_slice(self, children):
+        ground = all(c[2] for c in children)
+        # Slices aren't referenced weakly, so a canonical slice can be evicted
+        # while it's still in use; that's why it's identified by its elements.
+        key = (_slice_marker,) + tuple(c[1] for c in children)
+
+        if None in key:
+            return slice(*(c[0] for c in children)), None, ground
+
+        slices = self._slices
+        res = slices.get(key)
+
+        if res is None:
+            res = slices[key] = slice(*(c[0] for c in children))
+            if len(slices) > self.slice_maxsize:
+                slices.popitem(last=False)
+        else:
+            slices.move_to_end(key)
+
+        return res, key, ground
+
+
+def _cons_atom(t):
+    if isvar(t):
+        return t, (type(t), t), False
+
+    try:
+        key = (type(t), t)
+        hash(key)
+    except TypeError:
+        # Unhashable atoms are kept alive by the terms that contain them.
+        key = (_unhashable_marker, id(t))
+
+    return t, key, type(t) in _ground_types
+
+
+def _cons_element(t):
+    t_type = type(t)
+
+    if t_type is HashConsedTuple:
+        return t, id(t), t.ground
+    elif t_type is tuple or t_type is list or t_type is slice:
+        # Like unhashable atoms, these are kept alive by the canonical tuple.
+        return t, (_unhashable_marker, id(t)), False
+
+    return _cons_atom(t)
+
+
+_table = HashConsTable()
+
+
+def hashcons(term):
+    """Return the canonical version of `term` from the default table.
+
+    Tuples and lists are hash-consed to `HashConsedTuple`s, and slices are
+    shared when possible; all other terms are left as they are.
+    """
+    return _table.cons(term)
+
+
+def _hashcons_elements(items):
+    """Return the canonical tuple of `items` from the default table."""
+    return _table.cons_elements(items)
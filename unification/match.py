@@ -1,6 +1,7 @@
 from toolz import first, groupby
 
-from .core import reify, unify
+from .core import _fingerprints_compatible, fingerprint, reify, unify, unify_inplace
+from .substitution import TrailSubstitution
 from .utils import _toposort, freeze
 from .variable import isvar
 
@@ -9,10 +10,13 @@ class Dispatcher(object):
     def __init__(self, name):
         self.name = name
         self.funcs = dict()
+        self.fingerprints = dict()
         self.ordering = []
 
     def add(self, signature, func):
-        self.funcs[freeze(signature)] = func
+        signature = freeze(signature)
+        self.funcs[signature] = func
+        self.fingerprints[signature] = fingerprint(signature)
         self.ordering = ordering(self.funcs)
 
     def __call__(self, *args, **kwargs):
@@ -22,11 +26,14 @@ class Dispatcher(object):
     def resolve(self, args):
         n = len(args)
         frozen_args = freeze(args)
+        fp = fingerprint(frozen_args)
+        s = TrailSubstitution()
         for signature in self.ordering:
             if len(signature) != n:
                 continue
-            s = unify(frozen_args, signature)
-            if s is not False:
+            if not _fingerprints_compatible(fp, self.fingerprints[signature]):
+                continue
+            if unify_inplace(frozen_args, signature, s) is not False:
                 result = self.funcs[signature]
                 return result, s
         raise NotImplementedError(
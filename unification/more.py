@@ -59,7 +59,7 @@ def _reify_object_dict(o, s):
 
     yield construction_sentinel
 
-    if d == o.__dict__:
+    if d is o.__dict__:
         yield o
     else:
         obj.__dict__.update(d)
@@ -72,7 +72,7 @@ def _reify_object_slots(o, s):
 
     yield construction_sentinel
 
-    if attrs == new_attrs:
+    if new_attrs is attrs:
         yield o
     else:
         newobj = object.__new__(type(o))
@@ -0,0 +1,811 @@
+from collections.abc import Mapping, MutableMapping
+
+from .variable import IndexedVar, isvar
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+_missing = object()
+
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:  # pragma: no cover
+
+    def _popcount(x):
+        return bin(x).count("1")
+
+
+class _BitmapNode(object):
+    """A HAMT node holding up to 32 entries indexed by a bitmap.
+
+    Each entry is either a `(hash, key, value)` leaf tuple or a sub-node.
+    """
+
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _CollisionNode(object):
+    """A HAMT node for keys whose (masked) hashes are identical."""
+
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, hash, entries):
+        self.hash = hash
+        self.entries = entries
+
+
+_empty_node = _BitmapNode(0, ())
+
+
+def _make_pair(shift, e1, e2):
+    """Create a node containing the two leaves `e1` and `e2`."""
+    if shift >= _HASH_BITS:
+        return _CollisionNode(e1[0], (e1, e2))
+
+    i1 = (e1[0] >> shift) & _MASK
+    i2 = (e2[0] >> shift) & _MASK
+
+    if i1 == i2:
+        return _BitmapNode(1 << i1, (_make_pair(shift + _BITS, e1, e2),))
+    elif i1 < i2:
+        return _BitmapNode((1 << i1) | (1 << i2), (e1, e2))
+    else:
+        return _BitmapNode((1 << i1) | (1 << i2), (e2, e1))
+
+
+def _node_get(node, h, key):
+    shift = 0
+    while True:
+        if type(node) is _CollisionNode:
+            for _, k, v in node.entries:
+                if k is key or k == key:
+                    return v
+            return _missing
+
+        bit = 1 << ((h >> shift) & _MASK)
+        bitmap = node.bitmap
+
+        if not bitmap & bit:
+            return _missing
+
+        e = node.entries[_popcount(bitmap & (bit - 1))]
+
+        if type(e) is tuple:
+            if e[0] == h and (e[1] is key or e[1] == key):
+                return e[2]
+            return _missing
+
+        node = e
+        shift += _BITS
+
+
+def _node_set(node, shift, leaf):
+    """Return a new node with `leaf` inserted and whether the size increased."""
+    h, key, value = leaf
+
+    if type(node) is _CollisionNode:
+        entries = node.entries
+        for i, (_, k, v) in enumerate(entries):
+            if k is key or k == key:
+                if v is value:
+                    return node, False
+                return (
+                    _CollisionNode(h, entries[:i] + (leaf,) + entries[i + 1 :]),
+                    False,
+                )
+        return _CollisionNode(h, entries + (leaf,)), True
+
+    bit = 1 << ((h >> shift) & _MASK)
+    bitmap = node.bitmap
+    entries = node.entries
+    idx = _popcount(bitmap & (bit - 1))
+
+    if not bitmap & bit:
+        return (
+            _BitmapNode(bitmap | bit, entries[:idx] + (leaf,) + entries[idx:]),
+            True,
+        )
+
+    e = entries[idx]
+
+    if type(e) is tuple:
+        if e[0] == h and (e[1] is key or e[1] == key):
+            if e[2] is value:
+                return node, False
+            new_e, added = leaf, False
+        else:
+            new_e, added = _make_pair(shift + _BITS, e, leaf), True
+    else:
+        new_e, added = _node_set(e, shift + _BITS, leaf)
+        if new_e is e:
+            return node, False
+
+    return _BitmapNode(bitmap, entries[:idx] + (new_e,) + entries[idx + 1 :]), added
+
+
+def _node_delete(node, shift, h, key):
+    """Return a new node without `key`, or `None` if the node is now empty.
+
+    The node itself is returned when `key` isn't present.
+    """
+    if type(node) is _CollisionNode:
+        entries = tuple(e for e in node.entries if not (e[1] is key or e[1] == key))
+        if len(entries) == len(node.entries):
+            return node
+        if len(entries) == 1:
+            return _BitmapNode(1 << ((h >> shift) & _MASK), entries)
+        return _CollisionNode(node.hash, entries)
+
+    bit = 1 << ((h >> shift) & _MASK)
+    bitmap = node.bitmap
+
+    if not bitmap & bit:
+        return node
+
+    entries = node.entries
+    idx = _popcount(bitmap & (bit - 1))
+    e = entries[idx]
+
+    if type(e) is tuple:
+        if not (e[0] == h and (e[1] is key or e[1] == key)):
+            return node
+        new_e = None
+    else:
+        new_e = _node_delete(e, shift + _BITS, h, key)
+        if new_e is e:
+            return node
+
+    if new_e is None:
+        if bitmap == bit:
+            return None
+        return _BitmapNode(bitmap & ~bit, entries[:idx] + entries[idx + 1 :])
+
+    return _BitmapNode(bitmap, entries[:idx] + (new_e,) + entries[idx + 1 :])
+
+
+def _node_leaves(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for e in reversed(node.entries):
+            if type(e) is tuple:
+                yield e
+            else:
+                stack.append(e)
+
+
+class Substitution(Mapping):
+    """A persistent (i.e. immutable) substitution mapping.
+
+    The mapping is stored as a hash array mapped trie (HAMT), so that adding
+    a binding with `Substitution.set` shares all but O(log n) of the
+    original's structure instead of copying it.  This makes `assoc`--and, as a
+    result, each binding made by `unify`--cost O(log n) instead of O(n).
+
+    >>> x, y = var('x'), var('y')
+    >>> s = Substitution({x: 1})
+    >>> s2 = s.set(y, 2)
+    >>> s2 == {x: 1, y: 2}
+    True
+    >>> s
+    Substitution({~x: 1})
+    >>> unify((x, y), (1, 3), s) == {x: 1, y: 3}
+    True
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, *args, **kwargs):
+        root, size = _empty_node, 0
+        for key, value in dict(*args, **kwargs).items():
+            root, added = _node_set(root, 0, (hash(key) & _HASH_MASK, key, value))
+            size += added
+        self._root = root
+        self._size = size
+
+    @classmethod
+    def _from_root(cls, root, size):
+        obj = object.__new__(cls)
+        obj._root = root
+        obj._size = size
+        return obj
+
+    def __getitem__(self, key):
+        value = _node_get(self._root, hash(key) & _HASH_MASK, key)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return _node_get(self._root, hash(key) & _HASH_MASK, key) is not _missing
+
+    def get(self, key, default=None):
+        value = _node_get(self._root, hash(key) & _HASH_MASK, key)
+        return default if value is _missing else value
+
+    def __iter__(self):
+        for _, k, _ in _node_leaves(self._root):
+            yield k
+
+    def __len__(self):
+        return self._size
+
+    def set(self, key, value):
+        """Return a new substitution with `key` bound to `value`."""
+        root, added = _node_set(self._root, 0, (hash(key) & _HASH_MASK, key, value))
+        if root is self._root:
+            return self
+        return self._from_root(root, self._size + added)
+
+    def delete(self, key):
+        """Return a new substitution without a binding for `key`."""
+        root = _node_delete(self._root, 0, hash(key) & _HASH_MASK, key)
+        if root is self._root:
+            raise KeyError(key)
+        if root is None:
+            root = _empty_node
+        return self._from_root(root, self._size - 1)
+
+    def copy(self):
+        return self
+
+    def _keys_not_in(self, other):
+        """Return the keys of this substitution that aren't in `other`.
+
+        `other` must be a `Substitution`, too.  Only the nodes that aren't
+        shared with `other` are visited, so when this substitution was derived
+        from `other`, this takes time proportional to the changes.
+        """
+        other_root = other._root
+        res = []
+        stack = [(self._root, other_root)]
+
+        while stack:
+            node, old = stack.pop()
+
+            if node is old:
+                continue
+            elif type(node) is tuple:
+                leaves = (node,)
+            elif type(node) is _CollisionNode:
+                leaves = node.entries
+            elif type(old) is _BitmapNode:
+                old_bitmap, old_entries = old.bitmap, old.entries
+                bitmap = node.bitmap
+                for e in node.entries:
+                    bit = bitmap & -bitmap
+                    bitmap ^= bit
+                    if old_bitmap & bit:
+                        stack.append(
+                            (e, old_entries[_popcount(old_bitmap & (bit - 1))])
+                        )
+                    else:
+                        stack.append((e, None))
+                continue
+            else:
+                leaves = _node_leaves(node)
+
+            for h, k, _ in leaves:
+                if _node_get(other_root, h, k) is _missing:
+                    res.append(k)
+
+        return res
+
+    def __reduce__(self):
+        # The trie depends on the keys' hashes, which can differ between
+        # processes (e.g. for `str`s), so it's rebuilt from the bindings.
+        return (type(self), (dict(self.items()),))
+
+    def __repr__(self):
+        items = ", ".join(f"{k!r}: {v!r}" for _, k, v in _node_leaves(self._root))
+        return f"{type(self).__name__}({{{items}}})"
+
+
+class TrailSubstitution(dict):
+    """A mutable substitution that records a trail of its changes.
+
+    Bindings are added in-place (i.e. `assoc` doesn't copy the substitution),
+    and every change is recorded so that it can be undone by
+    `TrailSubstitution.rollback`.  This makes failed unification attempts
+    cheap, since nothing needs to be copied up-front.
+
+    >>> x, y = var('x'), var('y')
+    >>> s = TrailSubstitution({x: 1})
+    >>> mark = s.checkpoint()
+    >>> unify(y, 2, s)
+    TrailSubstitution({~x: 1, ~y: 2})
+    >>> s.rollback(mark)
+    >>> s
+    TrailSubstitution({~x: 1})
+    """
+
+    __slots__ = ("_trail",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trail = []
+
+    def checkpoint(self):
+        """Return a marker for the current state of the substitution."""
+        return len(self._trail)
+
+    def rollback(self, mark):
+        """Undo all the changes made after `mark` was obtained."""
+        trail = self._trail
+        while len(trail) > mark:
+            key, old = trail.pop()
+            if old is _missing:
+                dict.__delitem__(self, key)
+            else:
+                dict.__setitem__(self, key, old)
+
+    def __setitem__(self, key, value):
+        self._trail.append((key, dict.get(self, key, _missing)))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        old = dict.pop(self, key)
+        self._trail.append((key, old))
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key not in self:
+            return dict.pop(self, key, *args)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._trail.append((key, value))
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def copy(self):
+        return type(self)(self)
+
+    def __reduce__(self):
+        # The trail isn't restored, and the bindings can't be added (with
+        # `__setitem__`) before it exists.
+        return (type(self), (dict(self),))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict.__repr__(self)})"
+
+
+class UnionFindSubstitution(dict):
+    """A mutable substitution that keeps variable chains short.
+
+    Variable-to-variable bindings are treated as a union-find forest: when two
+    unbound variables are unified, the one with the lower rank is bound to the
+    other (i.e. union-by-rank), and every lookup of a variable re-binds the
+    variables along its chain directly to the chain's end (i.e. path
+    compression).  Walking a variable therefore takes amortized near-constant
+    time instead of time proportional to its chain's length.
+
+    Like `TrailSubstitution`, bindings are added in-place; however, since
+    lookups rewrite the stored bindings, there is no rollback, and a failed
+    `unify` can leave partial bindings behind.
+
+    >>> x, y, z = var('x'), var('y'), var('z')
+    >>> s = UnionFindSubstitution({x: y, y: z})
+    >>> s[x]
+    ~z
+    >>> s
+    UnionFindSubstitution({~x: ~z, ~y: ~z})
+    """
+
+    __slots__ = ("_rank",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rank = {}
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+
+        if not isvar(value) or not dict.__contains__(self, value):
+            return value
+
+        path = [key]
+        while isvar(value) and dict.__contains__(self, value):
+            path.append(value)
+            value = dict.__getitem__(self, value)
+
+        for k in path:
+            dict.__setitem__(self, k, value)
+
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def union(self, u, v):
+        """Bind the unbound variable `u` to `v`, using union-by-rank when `v` is also an unbound variable."""  # noqa: E501
+        if isvar(v) and v not in self:
+            rank = self._rank
+            u_rank = rank.get(u, 0)
+            v_rank = rank.get(v, 0)
+
+            if u_rank > v_rank:
+                u, v = v, u
+            elif u_rank == v_rank:
+                rank[v] = v_rank + 1
+
+            rank.pop(u, None)
+
+        dict.__setitem__(self, u, v)
+
+    def copy(self):
+        res = type(self)(self)
+        res._rank = self._rank.copy()
+        return res
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict.__repr__(self)})"
+
+
+class NormalizedSubstitution(dict):
+    """A substitution in which every binding is fully reified.
+
+    Values never contain bound variables, so a variable can be reified with a
+    single lookup.  Instances are produced by `unification.core.normalize` and
+    shouldn't be extended by hand; `assoc` returns a plain `dict` copy.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict.__repr__(self)})"
+
+
+class ArraySubstitution(MutableMapping):
+    """A mutable substitution that stores `IndexedVar` bindings in a list.
+
+    The bindings of `IndexedVar`s are stored at their indices (relative to
+    the smallest index seen by the substitution), so looking them up doesn't
+    involve any hashing.  All other keys are stored in a regular `dict`.
+    Since the list spans the range of the bound indices, this is best suited
+    for densely numbered variables (e.g. those created during a single solver
+    run).
+
+    Like `TrailSubstitution`, bindings are added in-place and can be undone
+    with `ArraySubstitution.rollback`.
+
+    >>> x, y = IndexedVar(), IndexedVar()
+    >>> s = unify((x, y), (1, 2), ArraySubstitution())
+    >>> s[x], s[y]
+    (1, 2)
+    """
+
+    __slots__ = ("_keys", "_values", "_base", "_other", "_size", "_trail")
+
+    def __init__(self, *args, **kwargs):
+        self._keys = []
+        self._values = []
+        self._base = 0
+        self._other = {}
+        self._size = 0
+        self._trail = []
+        self.update(*args, **kwargs)
+        self._trail.clear()
+
+    def __getitem__(self, key):
+        if type(key) is IndexedVar:
+            i = key.index - self._base
+            values = self._values
+            if 0 <= i < len(values):
+                value = values[i]
+                if value is not _missing:
+                    return value
+            raise KeyError(key)
+
+        return self._other[key]
+
+    def __contains__(self, key):
+        if type(key) is IndexedVar:
+            i = key.index - self._base
+            values = self._values
+            return 0 <= i < len(values) and values[i] is not _missing
+
+        return key in self._other
+
+    def get(self, key, default=None):
+        if type(key) is IndexedVar:
+            i = key.index - self._base
+            values = self._values
+            if 0 <= i < len(values):
+                value = values[i]
+                if value is not _missing:
+                    return value
+            return default
+
+        return self._other.get(key, default)
+
+    def _set(self, key, value):
+        if type(key) is IndexedVar:
+            values = self._values
+
+            if not values:
+                self._base = key.index
+
+            i = key.index - self._base
+
+            if i < 0:
+                # The list is (at least) doubled, so that binding indices in
+                # decreasing order takes amortized constant time.
+                n = max(-i, len(values))
+                values[:0] = [_missing] * n
+                self._keys[:0] = [None] * n
+                self._base -= n
+                i += n
+            elif i >= len(values):
+                n = i + 1 - len(values)
+                values.extend([_missing] * n)
+                self._keys.extend([None] * n)
+
+            old = values[i]
+            values[i] = value
+
+            if value is _missing:
+                self._keys[i] = None
+            else:
+                self._keys[i] = key
+        else:
+            old = self._other.get(key, _missing)
+            if value is _missing:
+                del self._other[key]
+            else:
+                self._other[key] = value
+
+        self._size += (value is not _missing) - (old is not _missing)
+
+        return old
+
+    def __setitem__(self, key, value):
+        self._trail.append((key, self._set(key, value)))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._trail.append((key, self._set(key, _missing)))
+
+    def __iter__(self):
+        for key in self._keys:
+            if key is not None:
+                yield key
+        yield from self._other
+
+    def __len__(self):
+        return self._size
+
+    def checkpoint(self):
+        """Return a marker for the current state of the substitution."""
+        return len(self._trail)
+
+    def rollback(self, mark):
+        """Undo all the changes made after `mark` was obtained."""
+        trail = self._trail
+        while len(trail) > mark:
+            key, old = trail.pop()
+            self._set(key, old)
+
+    def copy(self):
+        res = type(self)()
+        res._keys = self._keys.copy()
+        res._values = self._values.copy()
+        res._base = self._base
+        res._other = self._other.copy()
+        res._size = self._size
+        return res
+
+    def __reduce__(self):
+        # Restored `IndexedVar`s can have different indices, so the bindings
+        # are stored again.
+        return (type(self), (dict(self.items()),))
+
+    def __repr__(self):
+        items = ", ".join(f"{k!r}: {v!r}" for k, v in self.items())
+        return f"{type(self).__name__}({{{items}}})"
+
+
+class LayeredSubstitution(Mapping):
+    """An immutable substitution made of a small overlay on top of a parent.
+
+    The overlay is a persistent `Substitution`, so adding a binding never
+    copies the parent or the overlay, and the cost of extending a large base
+    substitution scales with the number of new bindings rather than the size
+    of the base.  Layers can be stacked; once a stack is deeper than
+    `LayeredSubstitution.max_depth`, the parent layers are merged into a single
+    layer over the base mapping, which is never copied.
+
+    >>> x, y = var('x'), var('y')
+    >>> base = {x: 1}
+    >>> s = unify((x, y), (1, 2), LayeredSubstitution(base))
+    >>> s.bindings
+    Substitution({~y: 2})
+    >>> s == {x: 1, y: 2}
+    True
+    """
+
+    __slots__ = ("parent", "bindings", "depth", "_size")
+
+    max_depth = 16
+
+    def __init__(self, parent=None, bindings=None):
+        if parent is None:
+            parent = {}
+
+        if type(parent) is LayeredSubstitution:
+            if parent.depth >= self.max_depth:
+                parent = parent.flatten()
+            depth = parent.depth + 1
+        else:
+            depth = 1
+
+        if type(bindings) is not Substitution:
+            bindings = Substitution(bindings or {})
+
+        self.parent = parent
+        self.bindings = bindings
+        self.depth = depth
+        self._size = len(parent) + sum(1 for k in bindings if k not in parent)
+
+    def flatten(self):
+        """Merge all the layers into a single layer over the base mapping."""
+        layers = []
+        base = self
+        while type(base) is LayeredSubstitution:
+            layers.append(base.bindings)
+            base = base.parent
+
+        bindings = {}
+        for layer in reversed(layers):
+            bindings.update(layer.items())
+
+        return LayeredSubstitution(base, bindings)
+
+    def set(self, key, value):
+        """Return a new substitution with `key` bound to `value`."""
+        res = object.__new__(type(self))
+        res.parent = self.parent
+        res.bindings = self.bindings.set(key, value)
+        res.depth = self.depth
+        res._size = self._size + (key not in self)
+        return res
+
+    def _lookup(self, key):
+        s = self
+        while type(s) is LayeredSubstitution:
+            value = s.bindings.get(key, _missing)
+            if value is not _missing:
+                return value
+            s = s.parent
+        return s.get(key, _missing)
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _missing
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _missing else value
+
+    def __iter__(self):
+        seen = set()
+        s = self
+        while type(s) is LayeredSubstitution:
+            for key in s.bindings:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+            s = s.parent
+        for key in s:
+            if key not in seen:
+                yield key
+
+    def __len__(self):
+        return self._size
+
+    def copy(self):
+        return self
+
+    def __repr__(self):
+        bindings = dict(self.bindings.items())
+        return f"{type(self).__name__}({self.parent!r}, {bindings!r})"
+
+
+class FrozenSubstitution(Substitution):
+    """A hashable `Substitution`.
+
+    The hash is the XOR of the hashes of the `(key, value)` bindings, so it's
+    updated in O(1) time when a binding is added or removed.  Substitutions
+    with unhashable values can still be created and used, but hashing them
+    raises a `TypeError`.
+
+    >>> x = var('x')
+    >>> s = FrozenSubstitution({x: 1})
+    >>> cache = {(x, s): 1}
+    >>> cache[(x, FrozenSubstitution().set(x, 1))]
+    1
+    """
+
+    __slots__ = ("_hash", "_unhashable")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        h, unhashable = 0, 0
+        for _, key, value in _node_leaves(self._root):
+            h, unhashable = _xor_binding_hash(h, unhashable, key, value)
+
+        self._hash = h
+        self._unhashable = unhashable
+
+    def set(self, key, value):
+        old = self.get(key, _missing)
+        res = super().set(key, value)
+
+        if res is self:
+            return self
+
+        h, unhashable = self._hash, self._unhashable
+        if old is not _missing:
+            h, unhashable = _xor_binding_hash(h, unhashable, key, old, -1)
+        res._hash, res._unhashable = _xor_binding_hash(h, unhashable, key, value)
+
+        return res
+
+    def delete(self, key):
+        old = self[key]
+        res = super().delete(key)
+        res._hash, res._unhashable = _xor_binding_hash(
+            self._hash, self._unhashable, key, old, -1
+        )
+        return res
+
+    def __hash__(self):
+        if self._unhashable:
+            raise TypeError(f"unhashable value in {type(self).__name__}")
+        return self._hash
+
+
+def _xor_binding_hash(h, unhashable, key, value, sign=1):
+    """Add (or, when `sign` is -1, remove) a binding to a `FrozenSubstitution` hash.
+
+    Returns the XOR of the hashes of the hashable bindings and the number of
+    unhashable bindings.
+    """
+    try:
+        return h ^ hash((key, value)), unhashable
+    except TypeError:
+        return h, unhashable + sign
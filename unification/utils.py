@@ -1,19 +1,29 @@
 from collections.abc import Mapping, Set
 from contextlib import suppress
 
+_missing = object()
+
 
 def transitive_get(key, d):
     """Get a value for a dict key in a transitive fashion.
 
+    Each step takes a single ``d.get`` call, so that mappings with costly
+    lookups (e.g. `unification.substitution.Substitution`) are only searched
+    once per step.
+
     >>> d = {1: 2, 2: 3, 3: 4}
     >>> d.get(1)
     2
     >>> transitive_get(1, d)
     4
     """
+    get = d.get
+
     with suppress(TypeError):
-        while key in d:
-            key = d[key]
+        value = get(key, _missing)
+        while value is not _missing:
+            key = value
+            value = get(key, _missing)
     return key
 
 
@@ -1,15 +1,92 @@
 import weakref
 from abc import ABCMeta
-from contextlib import contextmanager, suppress
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+from threading import Lock, local
 
-_global_logic_variables = set()
-_glv = _global_logic_variables
+# The innermost `variables` scope of the current context, as a
+# `(frozenset_of_objects, parent_scope)` pair, or `None` outside of any scope.
+_scope = ContextVar("unification.variables", default=None)
+
+# The number of `variables` scopes that are active in any context.  When it's
+# zero, `isvar` doesn't need to look up the current scope.
+_active_scopes = 0
+_active_scopes_lock = Lock()
+
+# Whether or not the instances of each exact type that has been seen are logic
+# variables.  `Var`, its (real and virtual) subclasses and `LVarType` are added
+# when they're created or registered, and any other type when `isvar` first
+# sees it.
+_var_types = {}
+
+# Whether or not strict mode (see `enable_strict_mode`) is enabled.
+_strict = False
 
 
 class LVarType(ABCMeta):
+    def __init__(cls, name, bases, namespace, **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
+        _var_types[cls] = True
+
+    def __init_subclass__(mcls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _var_types[mcls] = True
+
     def __instancecheck__(self, o):
-        with suppress(TypeError):
-            return issubclass(type(o), (Var, LVarType)) or o in _glv
+        return isvar(o)
+
+    def register(cls, subclass):
+        subclass = super().register(subclass)
+        _var_types[subclass] = True
+
+        # The subclasses of `subclass` might have been seen already.
+        for t, is_var_type in list(_var_types.items()):
+            if not is_var_type:
+                del _var_types[t]
+
+        return subclass
+
+
+_var_types[LVarType] = True
+
+
+# Fresh variable ids are handed out to each thread in blocks of
+# `_id_block_size`, which are reserved from `Var._id` while holding `_id_lock`.
+# Blocks from an older `_id_generation` are discarded (see `_restore_var`).
+_id_block_size = 1024
+_id_lock = Lock()
+_id_generation = 0
+_generation_start = 1
+
+
+class _IdBlock(local):
+    next = end = 0
+    generation = -1
+
+
+_id_block = _IdBlock()
+
+
+def _new_id():
+    """Return an id for a fresh variable's token that no other thread will use."""
+    block = _id_block
+    n = block.next
+
+    if n >= block.end or block.generation != _id_generation:
+        with _id_lock:
+            n = Var._id
+            Var._id = block.end = n + _id_block_size
+            block.generation = _id_generation
+
+    block.next = n + 1
+
+    return n
+
+
+# Interning (i.e. the check-then-insert on `_refs`) is serialized per token by
+# one of these locks.
+_intern_locks = tuple(Lock() for _ in range(64))
 
 
 class Var(metaclass=LVarType):
@@ -44,15 +121,19 @@ class Var(metaclass=LVarType):
             output.
         """
         if token is None:
-            token = f"{prefix}_{Var._id}"
-            cls._id += 1
+            token = f"{prefix}_{_new_id()}"
 
-        obj = cls._refs.get(token, None)
+        refs = cls._refs
+        obj = refs.get(token, None)
 
         if obj is None:
-            obj = object.__new__(cls)
-            obj.token = token
-            cls._refs[token] = obj
+            with _intern_locks[hash(token) % len(_intern_locks)]:
+                obj = refs.get(token, None)
+
+                if obj is None:
+                    obj = object.__new__(cls)
+                    obj.token = token
+                    refs[token] = obj
 
         return obj
 
@@ -69,6 +150,109 @@ class Var(metaclass=LVarType):
     def __hash__(self):
         return hash((type(self), self.token))
 
+    def __reduce__(self):
+        return (_restore_var, (type(self), self.token))
+
+
+def _restore_var(cls, token):
+    """Re-create--and re-intern--a logic variable that was serialized.
+
+    When the token looks like one generated for a fresh variable, the internal
+    count is advanced past it, so that fresh variables created afterward can't
+    be confused with the restored one.  Since the id might also belong to a
+    block that a thread has reserved but not used up, every thread's block is
+    discarded in that case, too.  Neither is needed when the variable is still
+    interned (e.g. when it's copied within the same process).
+    """
+    global _id_generation, _generation_start
+
+    obj = cls._refs.get(token, None)
+
+    if obj is not None:
+        return obj
+
+    if isinstance(token, str):
+        _, sep, n = token.rpartition("_")
+        if sep and n.isdecimal() and int(n) >= _generation_start:
+            with _id_lock:
+                Var._id = max(Var._id, int(n) + 1)
+                _generation_start = Var._id
+                _id_generation += 1
+
+    return cls(token)
+
+
+class IndexedVar(Var):
+    """A logic variable that carries a compact integer index.
+
+    Indices are assigned in creation order, starting from zero, so
+    substitutions over these variables can be stored densely (see
+    `unification.substitution.ArraySubstitution`).
+
+        >>> a, b = IndexedVar(), IndexedVar()
+        >>> b.index - a.index
+        1
+
+    """
+
+    __slots__ = ("index",)
+    _refs = weakref.WeakValueDictionary()
+    _next_index = 0
+    _index_lock = Lock()
+
+    def __new__(cls, token=None, prefix=""):
+        obj = super().__new__(cls, token, prefix)
+
+        if not hasattr(obj, "index"):
+            with IndexedVar._index_lock:
+                if not hasattr(obj, "index"):
+                    obj.index = IndexedVar._next_index
+                    IndexedVar._next_index += 1
+
+        return obj
+
+
+class AnonVar(Var):
+    """An anonymous logic variable.
+
+    Anonymous variables aren't interned: every one is distinct, they compare
+    by identity and their tokens are only generated when they're needed (e.g.
+    when they're printed).  This makes them much cheaper to create than `Var`s
+    with fresh tokens.
+
+        >>> x = fresh()
+        >>> x == x, x == fresh()
+        (True, False)
+
+    """
+
+    __slots__ = ("_n",)
+    _ids = count(1)
+
+    __new__ = object.__new__
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    @property
+    def token(self):
+        try:
+            n = self._n
+        except AttributeError:
+            n = self._n = next(AnonVar._ids)
+        return f"_a{n}"
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Anonymous variables can't be re-identified, so a new one is created.
+        return (AnonVar, ())
+
+
+fresh = AnonVar
 
 var = Var
 
@@ -78,14 +262,81 @@ def vars(n, **kwargs):
     return [var(**kwargs) for i in range(n)]
 
 
+def _is_var_type(t):
+    """Determine whether `t` is a subclass of `Var`, and record the result."""
+    res = _var_types[t] = issubclass(t, Var)
+    return res
+
+
 def isvar(o):
-    return isinstance(o, Var)
+    """Determine whether `o` is a logic variable.
+
+    Besides instances of `Var`, the objects passed to `variables` are logic
+    variables, unless strict mode is enabled.
+    """
+    try:
+        is_var_type = _var_types[type(o)]
+    except KeyError:
+        is_var_type = _is_var_type(type(o))
+
+    if is_var_type:
+        return True
+    elif not _active_scopes:
+        return False
+
+    scope = _scope.get()
+
+    try:
+        while scope is not None:
+            lvars, scope = scope
+            if o in lvars:
+                return True
+    except TypeError:
+        pass
+
+    return False
+
+
+def isvar_strict(o):
+    """Determine whether `o` is an instance of `Var` (or one of its subclasses).
+
+    Unlike `isvar`, this ignores the objects passed to `variables`; it's
+    equivalent to `isvar` in strict mode.
+    """
+    try:
+        return _var_types[type(o)]
+    except KeyError:
+        return _is_var_type(type(o))
+
+
+def enable_strict_mode():
+    """Only consider instances of `Var` to be logic variables.
+
+    In strict mode, `variables` can't be used, so `isvar` never needs to look
+    up the objects passed to it.
+    """
+    global _strict
+
+    if _active_scopes:
+        raise RuntimeError("Strict mode can't be enabled within `variables`")
+
+    _strict = True
+
+
+def disable_strict_mode():
+    """Allow arbitrary objects to be logic variables again (see `variables`)."""
+    global _strict
+    _strict = False
 
 
 @contextmanager
 def variables(*variables):
     """Create a context manager within which arbitrary objects can be logic variables.
 
+    Scopes are local to the current thread and `asyncio` task (i.e. the
+    current `contextvars` context), and nested scopes extend the enclosing
+    ones.
+
     >>> with variables(1):
     ...     print(isvar(1))
     True
@@ -105,10 +356,17 @@ def variables(*variables):
     ...     print(unify('x', 1))
     {'x': 1}
     """
-    old_global_logic_variables = _global_logic_variables.copy()
-    _global_logic_variables.update(set(variables))
+    if _strict:
+        raise RuntimeError("`variables` can't be used in strict mode")
+
+    global _active_scopes
+
+    token = _scope.set((frozenset(variables), _scope.get()))
+    with _active_scopes_lock:
+        _active_scopes += 1
     try:
         yield
     finally:
-        _global_logic_variables.clear()
-        _global_logic_variables.update(old_global_logic_variables)
+        with _active_scopes_lock:
+            _active_scopes -= 1
+        _scope.reset(token)